@@ -1,8 +1,11 @@
 # Imports
-import duckdb          # For interacting with DuckDB databases
 import logging         # For logging messages and errors
-import pandas as pd    # For data manipulation and analysis
+import pyarrow as pa   # For columnar query results
+import pyarrow.compute as pc  # For splitting result batches by color
+import pyarrow.parquet as pq  # For writing time series to parquet
 import matplotlib.pyplot as plt  # For plotting data
+import numpy as np     # For joining streamed result columns
+from resources import connect, telemetry  # Connections with the project's resource settings
 
 # Initializing logger
 logging.basicConfig(
@@ -12,172 +15,318 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)  # Create a logger instance
 
+# Calendar fields ranked by average CO2, with the label used in the report
+PERIODS = [
+    ('hour_of_day', 'hour of the day'),
+    ('day_of_week', 'day of the week'),
+    ('week_of_year', 'week of the year'),
+    ('month_of_year', 'month of the year'),
+]
+
+# Compute every aggregate the report needs for both colors in a single GROUPING SETS scan
+def co2_groupings(con, tables):
+    periods = ', '.join(column for column, _ in PERIODS)
+    grouping_sets = ', '.join(['(color)'] + [f'(color, {column})' for column, _ in PERIODS])
+
+    rows = con.execute(f"""
+        -- Union both colors' final tables and aggregate every grouping in one pass
+        WITH trips AS (
+            SELECT 'YELLOW' AS color, pickup_time, dropoff_time, trip_co2_kgs, {periods}
+            FROM {tables['YELLOW']}
+            UNION ALL
+            SELECT 'GREEN' AS color, pickup_time, dropoff_time, trip_co2_kgs, {periods}
+            FROM {tables['GREEN']}
+        )
+        SELECT
+            color, {periods},
+            GROUPING({periods}) AS grouping_id,
+            AVG(trip_co2_kgs) AS avg_co2_kgs,
+            arg_max(struct_pack(pickup_time, dropoff_time, trip_co2_kgs), trip_co2_kgs) AS max_trip
+        FROM trips
+        GROUP BY GROUPING SETS ({grouping_sets});
+    """).fetchall()
+
+    # Sort the small result into per-color answers: the heaviest trip and average CO2 per period value
+    results = {color: {'periods': {column: {} for column, _ in PERIODS}} for color in ['YELLOW', 'GREEN']}
+    grouped = len(PERIODS)  # Number of columns in the GROUPING() bitmask
+    for row in rows:
+        color, *values, grouping_id, avg_co2, max_trip = row
+        # A bit is 0 for each column that is part of this row's grouping set
+        in_set = [not (grouping_id >> (grouped - 1 - i)) & 1 for i in range(grouped)]
+        if not any(in_set):
+            results[color]['max_trip'] = max_trip
+        else:
+            for (column, _), value, selected in zip(PERIODS, values, in_set):
+                if selected and avg_co2 is not None:
+                    results[color]['periods'][column][value] = avg_co2
+    return results
+
+# Answer the same questions from the co2_cube dbt model, which holds a few hundred thousand pre-aggregated cells
+def co2_groupings_from_cube(con, tables):
+    periods = ', '.join(column for column, _ in PERIODS)
+    grouping_sets = ', '.join(f'(color, {column})' for column, _ in PERIODS)
+
+    rows = con.execute(f"""
+        -- Roll the cube up to each calendar field
+        SELECT
+            upper(color) AS color, {periods},
+            GROUPING({periods}) AS grouping_id,
+            SUM(sum_co2_kgs) / SUM(trip_count) AS avg_co2_kgs
+        FROM co2_cube
+        GROUP BY GROUPING SETS ({grouping_sets});
+    """).fetchall()
+
+    results = {color: {'periods': {column: {} for column, _ in PERIODS}} for color in ['YELLOW', 'GREEN']}
+    grouped = len(PERIODS)  # Number of columns in the GROUPING() bitmask
+    for row in rows:
+        color, *values, grouping_id, avg_co2 = row
+        in_set = [not (grouping_id >> (grouped - 1 - i)) & 1 for i in range(grouped)]
+        for (column, _), value, selected in zip(PERIODS, values, in_set):
+            if selected and avg_co2 is not None:
+                results[color]['periods'][column][value] = avg_co2
+
+    for color in ['YELLOW', 'GREEN']:
+        results[color]['max_trip'] = max_trip_from_cube(con, tables, color)
+    return results
+
+# The cube only knows the largest CO2 per cell, so the trip itself is looked up in that cell's month of row-level data
+def max_trip_from_cube(con, tables, color):
+    # One arg_max picks the year and month of the same cell, even when several cells tie on the maximum
+    cell, max_co2 = con.execute("""
+        SELECT arg_max(struct_pack(year, month_of_year), max_co2_kgs), MAX(max_co2_kgs)
+        FROM co2_cube
+        WHERE color = ?;
+    """, [color.lower()]).fetchone()
+    trip = None
+    if cell is not None:
+        trip = con.execute(f"""
+            -- Find the heaviest trip within its pickup month
+            SELECT struct_pack(pickup_time, dropoff_time, trip_co2_kgs)
+            FROM {tables[color]}
+            WHERE pickup_time >= make_date(?, ?, 1) AND pickup_time < make_date(?, ?, 1) + INTERVAL 1 MONTH
+              AND trip_co2_kgs = ?
+            LIMIT 1;
+        """, [cell['year'], cell['month_of_year'], cell['year'], cell['month_of_year'], max_co2]).fetchone()
+    if trip is None:
+        # The cube and the table disagree (e.g. the cube is stale), so scan the table for the heaviest trip
+        trip = con.execute(f"""
+            SELECT arg_max(struct_pack(pickup_time, dropoff_time, trip_co2_kgs), trip_co2_kgs)
+            FROM {tables[color]};
+        """).fetchone()
+    return trip[0]
+
+# Estimate the report from a random sample of the row-level tables, with 95% confidence interval half-widths:
+# period averages use the sample standard error, time-series totals the Horvitz-Thompson estimator for the sample rate
+# (system sampling takes whole blocks of rows and is fastest, but its intervals assume independent rows;
+# bernoulli sampling samples single rows and gives honest intervals at the cost of reading every row)
+def co2_groupings_sampled(con, tables, grain = 'month', percent = 1.0, method = 'system'):
+    periods = ', '.join(column for column, _ in PERIODS)
+    grouping_sets = ', '.join(['(color)'] + [f'(color, {column})' for column, _ in PERIODS] + ['(color, period)'])
+    fraction = percent / 100
+
+    rows = con.execute(f"""
+        -- Sample both colors' final tables and aggregate every grouping in one pass
+        WITH trips AS (
+            SELECT 'YELLOW' AS color, pickup_time, dropoff_time, trip_co2_kgs, {periods}
+            FROM {tables['YELLOW']} TABLESAMPLE {float(percent)}% ({method})
+            UNION ALL
+            SELECT 'GREEN' AS color, pickup_time, dropoff_time, trip_co2_kgs, {periods}
+            FROM {tables['GREEN']} TABLESAMPLE {float(percent)}% ({method})
+        )
+        SELECT
+            color, {periods},
+            CASE WHEN EXTRACT(YEAR FROM pickup_time) BETWEEN 2015 AND 2024
+                 THEN DATE_TRUNC('{grain}', pickup_time) END AS period,
+            GROUPING({periods}, period) AS grouping_id,
+            AVG(trip_co2_kgs) AS avg_co2_kgs,
+            1.96 * STDDEV_SAMP(trip_co2_kgs) / SQRT(COUNT(trip_co2_kgs)) AS avg_half_width,
+            SUM(trip_co2_kgs) / {fraction} AS total_co2_kgs,
+            1.96 * SQRT((1 - {fraction}) / ({fraction} * {fraction}) * SUM(trip_co2_kgs * trip_co2_kgs)) AS total_half_width,
+            arg_max(struct_pack(pickup_time, dropoff_time, trip_co2_kgs), trip_co2_kgs) AS max_trip
+        FROM trips
+        GROUP BY GROUPING SETS ({grouping_sets});
+    """).fetchall()
+
+    results = {
+        color: {'periods': {column: {} for column, _ in PERIODS}, 'intervals': {column: {} for column, _ in PERIODS}, 'series': []}
+        for color in ['YELLOW', 'GREEN']
+    }
+    grouped = len(PERIODS) + 1  # Number of columns in the GROUPING() bitmask
+    for row in rows:
+        color, *values, period, grouping_id, avg_co2, avg_half, total_co2, total_half, max_trip = row
+        in_set = [not (grouping_id >> (grouped - 1 - i)) & 1 for i in range(grouped)]
+        if not any(in_set):
+            results[color]['max_trip'] = max_trip
+        elif in_set[-1]:
+            if period is not None:
+                results[color]['series'].append((period, total_co2, total_half or 0.0))
+        else:
+            for (column, _), value, selected in zip(PERIODS, values, in_set):
+                if selected and avg_co2 is not None:
+                    results[color]['periods'][column][value] = avg_co2
+                    results[color]['intervals'][column][value] = avg_half or 0.0
+    for color in results:
+        # System sampling picks whole blocks, so a small table can come back empty
+        if 'max_trip' not in results[color]:
+            raise ValueError(f"The {percent}% {method} sample of {tables[color]} is empty; use a larger sample_percent")
+        results[color]['series'].sort()
+    return results
+
+# Stream CO2 totals per color and period start (dates built in SQL) as Arrow record batches;
+# monthly and yearly totals come from co2_cube when it exists, finer grains from the row-level tables
+def co2_timeseries(con, tables, has_cube, grain = 'month', batch_size = 100_000):
+    if has_cube and grain in ('month', 'year'):
+        query = f"""
+            -- Sum CO2 by {grain} for each color (2015-2024) from the cube
+            SELECT
+                color,
+                DATE_TRUNC('{grain}', make_date(CAST(year AS INTEGER), month_of_year, 1)) AS date,
+                SUM(sum_co2_kgs) AS trip_co2_kgs
+            FROM co2_cube
+            WHERE year BETWEEN 2015 AND 2024
+            GROUP BY ALL
+            ORDER BY color, date;
+        """
+    else:
+        query = f"""
+            -- Sum CO2 by {grain} for each color (2015-2024) from the row-level tables
+            SELECT color, DATE_TRUNC('{grain}', pickup_time) AS date, SUM(trip_co2_kgs) AS trip_co2_kgs
+            FROM (
+                SELECT 'yellow' AS color, pickup_time, trip_co2_kgs FROM {tables['YELLOW']}
+                UNION ALL
+                SELECT 'green' AS color, pickup_time, trip_co2_kgs FROM {tables['GREEN']}
+            )
+            WHERE EXTRACT(YEAR FROM pickup_time) BETWEEN 2015 AND 2024
+            GROUP BY ALL
+            ORDER BY color, date;
+        """
+    result = con.execute(query)
+
+    # Newer DuckDB releases renamed fetch_record_batch to to_arrow_reader
+    if hasattr(result, 'to_arrow_reader'):
+        return result.to_arrow_reader(batch_size)
+    return result.fetch_record_batch(batch_size)
+
+# Open a writer for the time series based on the file extension (.parquet, otherwise Arrow IPC)
+def open_writer(path, schema):
+    if path.endswith('.parquet'):
+        return pq.ParquetWriter(path, schema)
+    return pa.ipc.new_file(path, schema)
+
+# Confidence interval of a ranked answer, and a warning when it overlaps the runner-up's interval
+def interval_notes(averages, intervals, value, cond):
+    ranked = sorted(averages, key = averages.get, reverse = cond == 'HEAVIEST')
+    notes = [f"average {averages[value]:.4f} kg (95% CI {averages[value] - intervals[value]:.4f} to {averages[value] + intervals[value]:.4f})"]
+    if len(ranked) > 1:
+        runner_up = ranked[1]
+        if abs(averages[value] - averages[runner_up]) <= intervals[value] + intervals[runner_up]:
+            notes.append(f"NOT statistically separated from {runner_up} (95% CIs overlap)")
+    return notes
+
 # Function to analyze taxi carbon emissions data
-def analyze():
+# (compact reads row-level data from export.py's sorted parquet views instead of the final tables;
+#  grain sets the time-series period and timeseries_output optionally saves it as Arrow IPC or parquet;
+#  approximate answers from a sample_percent sample and reports 95% confidence intervals;
+#  snapshot reads the snapshot published by query_service.py instead of the live database, so the pipeline can keep writing;
+#  con lets pipeline.py run the analysis on its shared connection, in which case errors are re-raised to it)
+def analyze(compact = False, grain = 'month', timeseries_output = None, approximate = False,
+            sample_percent = 1.0, sample_method = 'system', snapshot = False, con = None):
 
-    con = None  # Placeholder for DuckDB connection
+    shared = con is not None  # Use the caller's connection if given
 
     # Try to connect to clean tables in DuckDB
     try:
         # Connect to local DuckDB instance (read/write mode)
-        con = duckdb.connect(database = 'emissions.duckdb', read_only = False)
+        if snapshot and not shared:
+            from query_service import current_snapshot
+            if current_snapshot() is None:
+                raise RuntimeError("No snapshot published; run 'python query_service.py publish'")
+            version, path = current_snapshot()
+            con = connect(database = path, read_only = True)
+        elif not shared:
+            con = connect()
         print("Connected to DuckDB instance")
         logger.info("Connected to DuckDB instance")
 
-        # Loop over taxi data tables (yellow and green)
-        for table, color in zip(['final_yellow_data', 'final_green_data'], ['YELLOW', 'GREEN']):
+        # Answer from the co2_cube dbt model when it exists, otherwise from one scan of the row-level tables;
+        # either way the answers below are picked from a small result
+        has_cube = con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'co2_cube';"
+        ).fetchone()[0]
+        tables = {color: f"final_{color.lower()}_data{'_compact' if compact else ''}" for color in ['YELLOW', 'GREEN']}
+        if approximate:
+            results = co2_groupings_sampled(con, tables, grain, sample_percent, sample_method)
+            print(f"Approximate analysis from a {sample_percent}% {sample_method} sample (95% confidence intervals)")
+            logger.info(f"Approximate analysis from a {sample_percent}% {sample_method} sample (95% confidence intervals)")
+        elif has_cube:
+            results = co2_groupings_from_cube(con, tables)
+        else:
+            results = co2_groupings(con, tables)
+
+        # Loop over taxi colors (yellow and green)
+        for color in ['YELLOW', 'GREEN']:
             
             print(f"Analysis for {color} taxi data:")
             logger.info(f"Analysis for {color} taxi data:")
 
-            # 1. Single largest carbon producing trip
-            maxco2_trip = con.execute(f"""
-                -- Get the trip with the maximum CO2 produced
-                SELECT pickup_time, dropoff_time, trip_co2_kgs
-                FROM {table}
-                ORDER BY trip_co2_kgs DESC
-                LIMIT 1;
-            """).fetchone()
-            pickup_time, dropoff_time, co2_kgs = maxco2_trip
+            # 1. Single largest carbon producing trip (a sample can miss it, so the cube answers it exactly when present)
+            max_trip = max_trip_from_cube(con, tables, color) if approximate and has_cube else results[color]['max_trip']
+            pickup_time, dropoff_time, co2_kgs = max_trip['pickup_time'], max_trip['dropoff_time'], max_trip['trip_co2_kgs']
             print(f"\tThe {color} taxi trip with the single largest carbon produced was the trip with pickup time: {pickup_time}, drop off time: {dropoff_time}, and {round(co2_kgs, 3)} kgs of carbon produced")
             logger.info(f"\tThe {color} taxi trip with the single largest carbon produced was the trip with pickup time: {pickup_time}, drop off time: {dropoff_time}, and {round(co2_kgs, 3)} kgs of carbon produced")
+            if approximate and not has_cube:
+                print(f"\t\t(largest trip in the sample, so the true largest trip may be heavier)")
+                logger.info(f"\t\t(largest trip in the sample, so the true largest trip may be heavier)")
 
-            # 2. Carbon heaviest and lightest hour of the day
-            co2_heavy_hour = con.execute(f"""
-                -- Get hour with highest average CO2
-                SELECT hour_of_day
-                FROM {table}
-                GROUP BY hour_of_day
-                ORDER BY AVG(trip_co2_kgs) DESC
-                LIMIT 1;
-            """).fetchone()[0]
-
-            co2_light_hour = con.execute(f"""
-                -- Get hour with lowest average CO2
-                SELECT hour_of_day
-                FROM {table}
-                GROUP BY hour_of_day
-                ORDER BY AVG(trip_co2_kgs) ASC
-                LIMIT 1;
-            """).fetchone()[0]
-            for cond, val in zip(['HEAVIEST', 'LIGHTEST'], [co2_heavy_hour, co2_light_hour]):
-                print(f"\tThe {cond} carbon hour of the day for {color} trips was: {val}")
-                logger.info(f"\tThe {cond} carbon hour of the day for {color} trips was: {val}")
-
-            # 3. Carbon heaviest and lightest day of the week
-            co2_heavy_day = con.execute(f"""
-                -- Get day of week with highest average CO2
-                SELECT day_of_week
-                FROM {table}
-                GROUP BY day_of_week
-                ORDER BY AVG(trip_co2_kgs) DESC
-                LIMIT 1;
-            """).fetchone()[0]
-
-            co2_light_day = con.execute(f"""
-                -- Get day of week with lowest average CO2
-                SELECT day_of_week
-                FROM {table}
-                GROUP BY day_of_week
-                ORDER BY AVG(trip_co2_kgs) ASC
-                LIMIT 1;
-            """).fetchone()[0]
-            for cond, val in zip(['HEAVIEST', 'LIGHTEST'], [co2_heavy_day, co2_light_day]):
-                print(f"\tThe {cond} carbon day of the week for {color} trips was: {val}")
-                logger.info(f"\tThe {cond} carbon day of the week for {color} trips was: {val}")
-
-            # 4. Carbon heaviest and lightest week of the year
-            co2_heavy_week = con.execute(f"""
-                -- Get week of year with highest average CO2
-                SELECT week_of_year
-                FROM {table}
-                GROUP BY week_of_year
-                ORDER BY AVG(trip_co2_kgs) DESC
-                LIMIT 1;
-            """).fetchone()[0]
-
-            co2_light_week = con.execute(f"""
-                -- Get week of year with lowest average CO2
-                SELECT week_of_year
-                FROM {table}
-                GROUP BY week_of_year
-                ORDER BY AVG(trip_co2_kgs) ASC
-                LIMIT 1;
-            """).fetchone()[0]
-            for cond, val in zip(['HEAVIEST', 'LIGHTEST'], [co2_heavy_week, co2_light_week]):
-                print(f"\tThe {cond} carbon week of the year for {color} trips was: {val}")
-                logger.info(f"\tThe {cond} carbon week of the year for {color} trips was: {val}")
-
-            # 5. Carbon heaviest and lightest month of the year
-            co2_heavy_month = con.execute(f"""
-                -- Get month of year with highest average CO2
-                SELECT month_of_year
-                FROM {table}
-                GROUP BY month_of_year
-                ORDER BY AVG(trip_co2_kgs) DESC
-                LIMIT 1;
-            """).fetchone()[0]
-
-            co2_light_month = con.execute(f"""
-                -- Get month of year with lowest average CO2
-                SELECT month_of_year
-                FROM {table}
-                GROUP BY month_of_year
-                ORDER BY AVG(trip_co2_kgs) ASC
-                LIMIT 1;
-            """).fetchone()[0]
-            for cond, val in zip(['HEAVIEST', 'LIGHTEST'], [co2_heavy_month, co2_light_month]):
-                print(f"\tThe {cond} carbon month of the year for {color} trips was: {val}")
-                logger.info(f"\tThe {cond} carbon month of the year for {color} trips was: {val}")    
+            # 2-5. Carbon heaviest and lightest hour of the day, day of the week, week of the year, and month of the year
+            for column, label in PERIODS:
+                averages = results[color]['periods'][column]
+                co2_heavy = max(averages, key = averages.get)
+                co2_light = min(averages, key = averages.get)
+                for cond, val in zip(['HEAVIEST', 'LIGHTEST'], [co2_heavy, co2_light]):
+                    print(f"\tThe {cond} carbon {label} for {color} trips was: {val}")
+                    logger.info(f"\tThe {cond} carbon {label} for {color} trips was: {val}")
+                    if approximate:
+                        for line in interval_notes(averages, results[color]['intervals'][column], val, cond):
+                            print(f"\t\t{line}")
+                            logger.info(f"\t\t{line}")
 
         # 6. Time-series plot of total CO2 by year for yellow and green taxis
 
-        # Aggregate yellow taxi data per month
-        yellow_agg = con.execute("""
-            -- Sum CO2 by month for yellow taxis (2015-2024)
-            SELECT
-                EXTRACT(YEAR FROM pickup_time) AS year,
-                EXTRACT(MONTH FROM pickup_time) AS month,
-                'yellow' AS color,
-                SUM(trip_co2_kgs) AS trip_co2_kgs
-            FROM final_yellow_data
-            WHERE EXTRACT(YEAR FROM pickup_time) BETWEEN 2015 AND 2024
-            GROUP BY year, month
-            ORDER BY year, month;
-        """).df()
-
-        # Aggregate green taxi data per month
-        green_agg = con.execute("""
-            -- Sum CO2 by month for green taxis (2015-2024)
-            SELECT
-                EXTRACT(YEAR FROM pickup_time) AS year,
-                EXTRACT(MONTH FROM pickup_time) AS month,
-                'green' AS color,
-                SUM(trip_co2_kgs) AS trip_co2_kgs
-            FROM final_green_data
-            WHERE EXTRACT(YEAR FROM pickup_time) BETWEEN 2015 AND 2024
-            GROUP BY year, month
-            ORDER BY year, month;
-        """).df()
+        # Approximate totals come with the sample; plot them with their confidence band
+        if approximate:
+            plt.figure(figsize=(12, 8))
+            for color in ['YELLOW', 'GREEN']:
+                if results[color]['series']:
+                    dates, totals, half_widths = (np.array(column) for column in zip(*results[color]['series']))
+                    plt.plot(dates, totals, marker='o', color = color.lower(), label=color.lower())
+                    plt.fill_between(dates, totals - half_widths, totals + half_widths, color = color.lower(), alpha = 0.2)
+        else:
+            # CO2 sums for each color (2015-2024), streamed in Arrow batches straight into per-color numpy arrays
+            reader = co2_timeseries(con, tables, has_cube, grain)
+            writer = open_writer(timeseries_output, reader.schema) if timeseries_output else None
+            series = {color: ([], []) for color in ['yellow', 'green']}
+            for batch in reader:
+                if writer:
+                    writer.write_batch(batch)
+                for color, (dates, totals) in series.items():
+                    subset = batch.filter(pc.equal(batch.column('color'), color))
+                    dates.append(subset.column('date').to_numpy())
+                    totals.append(subset.column('trip_co2_kgs').to_numpy())
+            if writer:
+                writer.close()
+                print(f"Saved CO2 time series to {timeseries_output}")
+                logger.info(f"Saved CO2 time series to {timeseries_output}")
 
-
-        # Combine yellow and green data
-        monthly_sum = pd.concat([yellow_agg, green_agg], axis=0, ignore_index=True)
-
-        # Create a proper datetime column (first day of each month)
-        monthly_sum['date'] = pd.to_datetime(
-            monthly_sum['year'].astype(str) + '-' + monthly_sum['month'].astype(str) + '-01'
-        )
-
-        # Plot CO2 time-series by taxi color
-        plt.figure(figsize=(12, 8))
-        for color in monthly_sum['color'].unique():
-            subset = monthly_sum[monthly_sum['color'] == color]
-            plt.plot(subset['date'], subset['trip_co2_kgs'], marker='o', color = color, label=color)
+            # Plot CO2 time-series by taxi color
+            plt.figure(figsize=(12, 8))
+            for color, (dates, totals) in series.items():
+                if dates:
+                    plt.plot(np.concatenate(dates), np.concatenate(totals), marker='o', color = color, label=color)
 
         plt.xlabel('Year')
         plt.ylabel('Sum of CO2 Production (Kg)')
-        plt.title("Total CO2 Production by Month (2015–2024)")
+        plt.title(f"Total CO2 Production by {grain.title()} (2015–2024)")
 
         # Show only years on x-axis
         import matplotlib.dates as mdates
@@ -192,10 +341,15 @@ def analyze():
         print("Plotted time-series analysis and saved as co2_timeseries_analysis.png")
         logger.info("Plotted time-series analysis and saved as co2_timeseries_analysis.png")
 
+        print(telemetry(con))
+        logger.info(telemetry(con))
+
     except Exception as e:
         # Handle any errors during analysis
         print(f"An error occurred: {e}")
         logger.error(f"An error occurred: {e}")
+        if shared:
+            raise
 
 
 # Run the analysis function if script is executed directly
@@ -0,0 +1,122 @@
+# Imports
+import argparse      # For command-line options
+import glob          # For finding each run's pipeline report
+import json          # For reading pipeline reports and writing results
+import logging       # For logging messages and errors
+import os            # For filesystem operations
+import shutil        # For setting up each scale's working directory
+import subprocess    # For running the pipeline in a fresh process per scale
+import sys           # For the current Python interpreter
+import time          # For naming result files
+
+# Initializing logger (before importing synthetic.py, which would otherwise configure logging to its own file)
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'benchmark.log'                           # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+from synthetic import generate, GENERATOR_VERSION  # Deterministic synthetic trip files
+
+# Repository root, holding the pipeline scripts, the dbt project and the emissions lookup
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Where generated sources, per-scale working directories and results go
+BENCH_DIR = 'bench'
+
+# Default yellow rows per monthly file (there are 120 yellow and 120 green files) for each scale
+SCALES = [100, 10_000, 100_000]
+
+
+# Generate a scale's source files once; later runs with the same scale, seed and generator version reuse them
+def sources(bench_dir, rows_per_file, seed):
+    path = os.path.abspath(os.path.join(bench_dir, 'sources', f'{rows_per_file}-{seed}'))
+    manifest = {}
+    if os.path.exists(os.path.join(path, 'manifest.json')):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    if manifest.get('generator_version') != GENERATOR_VERSION:
+        print(f"Generating synthetic files with {rows_per_file} rows per file")
+        logger.info(f"Generating synthetic files with {rows_per_file} rows per file")
+        generate(path, rows_per_file = rows_per_file, seed = seed)
+    return path
+
+
+# Fresh working directory with its own database, mirror and copy of the dbt project,
+# so a run never touches the repository's emissions.duckdb
+def workdir(bench_dir, rows_per_file):
+    path = os.path.abspath(os.path.join(bench_dir, 'runs', str(rows_per_file)))
+    shutil.rmtree(path, ignore_errors = True)
+    os.makedirs(path)
+    shutil.copytree(os.path.join(REPO_DIR, 'data'), os.path.join(path, 'data'))
+    shutil.copytree(os.path.join(REPO_DIR, 'dbt'), os.path.join(path, 'dbt'),
+                    ignore = shutil.ignore_patterns('target', 'logs', 'emissions', '*.duckdb'))
+    return path
+
+
+# Run the full pipeline on one scale in a new process and return its per-stage results
+def run_scale(bench_dir, rows_per_file, seed):
+    source_dir = sources(bench_dir, rows_per_file, seed)
+    with open(os.path.join(source_dir, 'manifest.json')) as f:
+        source_rows = sum(entry['rows'] for entry in json.load(f)['files'])
+
+    path = workdir(bench_dir, rows_per_file)
+    # dbt imports resources_plugin (and through it resources.py) from the repository, not the working directory
+    env = dict(os.environ, TLC_BASE_URL = source_dir, TLC_MIRROR_DIR = os.path.join(path, 'mirror'),
+               PYTHONPATH = os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    with open(os.path.join(path, 'pipeline.out'), 'w') as out:
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, 'pipeline.py')], cwd = path, env = env,
+                       stdout = out, stderr = subprocess.STDOUT, check = False)
+
+    reports = glob.glob(os.path.join(path, 'reports', 'pipeline-*.json'))
+    if not reports:
+        raise RuntimeError(f"Pipeline produced no report; see {os.path.join(path, 'pipeline.out')}")
+    with open(reports[0]) as f:
+        report = json.load(f)
+
+    # Throughput is measured against the source rows, so every stage is comparable across scales
+    return [
+        {'rows_per_file': rows_per_file, 'source_rows': source_rows, 'stage': stage['stage'], 'status': stage['status'],
+         'wall_seconds': stage['wall_seconds'], 'output_rows': stage['rows'],
+         'source_rows_per_second': source_rows / stage['wall_seconds'] if stage['wall_seconds'] else None,
+         'peak_rss_mb': stage['peak_rss_mb'], 'slowest_statement': stage['slowest_statement'],
+         'slowest_seconds': stage['slowest_seconds']}
+        for stage in report['stages']
+    ]
+
+
+# Time load(), clean(), the dbt models and analyze() at each scale and report throughput and peak memory
+def benchmark(scales = SCALES, seed = 0, bench_dir = BENCH_DIR):
+    results = []
+    for rows_per_file in scales:
+        print(f"Benchmarking {rows_per_file} rows per file")
+        logger.info(f"Benchmarking {rows_per_file} rows per file")
+        for row in run_scale(bench_dir, rows_per_file, seed):
+            results.append(row)
+            wall = f"{row['wall_seconds']:.2f}s" if row['wall_seconds'] is not None else '-'
+            rate = f"{row['source_rows_per_second']:,.0f} rows/s" if row['source_rows_per_second'] else '-'
+            memory = f"{row['peak_rss_mb']:.0f} MB" if row['peak_rss_mb'] is not None else '-'
+            print(f"\t{row['stage']:<10} {row['status']:<10} {wall:>10} {rate:>20} {memory:>10}")
+            logger.info(f"\t{row['stage']} {row['status']} {wall} {rate} {memory}")
+
+    path = os.path.join(bench_dir, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump({'seed': seed, 'results': results}, f, indent = 2)
+    print(f"Saved benchmark results to {path}")
+    logger.info(f"Saved benchmark results to {path}")
+    return results
+
+
+# Run the benchmark if script is executed directly ('python benchmark.py --scales 1000 1000000')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type = int, nargs = '+', default = SCALES,
+                        help = 'yellow rows per monthly file for each scale')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+    try:
+        benchmark(args.scales, args.seed)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
@@ -1,7 +1,10 @@
 # Imports
-import duckdb        # For interacting with DuckDB databases
 import logging       # For logging messages and errors
-import os            # For filesystem operations like creating directories
+import time          # For timing each partition
+import uuid          # For identifying each run's data-quality results
+from concurrent.futures import ThreadPoolExecutor  # For cleaning partitions in parallel
+from quality import keep_predicate, verify, TRIP_COLUMNS  # Cleaning rules shared with load.py
+from resources import connect, settings, telemetry  # Connections with the project's resource settings
 
 # Initializing logger
 logging.basicConfig(
@@ -11,90 +14,175 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)  # Create a logger instance
 
-# Function to clean taxi data tables prior to transformation and analysis
-def clean():
+# Clean and deduplicate one pickup month of a table into its staging table; returns (rows in, rows out, seconds)
+def clean_partition(con, table, month):
+    start = time.perf_counter()
+    cur = con.cursor()  # Each worker thread needs its own cursor
+    try:
+        rows_in = cur.execute(f"""
+            -- Count the partition's raw rows
+            SELECT COUNT(*) FROM {table}
+            WHERE pickup_time >= ? AND pickup_time < ? + INTERVAL 1 MONTH;
+        """, [month, month]).fetchone()[0]
+        rows_out = cur.execute(f"""
+            -- Identical trips share a pickup time, so deduplicating within the month is exact
+            INSERT INTO {table}_clean
+            SELECT DISTINCT ON ({', '.join(TRIP_COLUMNS)}) *
+            FROM {table}
+            WHERE pickup_time >= ? AND pickup_time < ? + INTERVAL 1 MONTH
+              AND {keep_predicate()};  -- Remove 0 passenger, 0 mile, >100 mile and >1 day trips (see quality.py)
+        """, [month, month]).fetchone()[0]
+    finally:
+        cur.close()
+    return rows_in, rows_out, time.perf_counter() - start
+
+# Clean a table partition by partition on pickup month, so memory tracks one month of data rather than the whole table
+def clean_partitioned(con, table, parallelism):
+
+    # Empty staging table with the same columns as the source
+    con.execute(f"CREATE OR REPLACE TABLE {table}_clean AS SELECT * FROM {table} LIMIT 0;")
+
+    # Pickup months present in the table (rows without a pickup time fail the cleaning rules anyway)
+    months = [row[0] for row in con.execute(f"""
+        SELECT DISTINCT date_trunc('month', pickup_time) AS month
+        FROM {table}
+        WHERE pickup_time IS NOT NULL
+        ORDER BY month;
+    """).fetchall()]
+
+    # Clean the partitions with a bounded pool of workers, reporting each as it finishes
+    with ThreadPoolExecutor(max_workers = parallelism) as pool:
+        for month, (rows_in, rows_out, seconds) in zip(months, pool.map(lambda m: clean_partition(con, table, m), months)):
+            print(f"\t{table} {month:%Y-%m}: {rows_in} rows in, {rows_out} rows out, {seconds:.2f}s")
+            logger.info(f"\t{table} {month:%Y-%m}: {rows_in} rows in, {rows_out} rows out, {seconds:.2f}s")
+
+    # Swap the cleaned table in for the original
+    con.execute("BEGIN TRANSACTION")
+    con.execute(f"DROP TABLE {table};")
+    con.execute(f"ALTER TABLE {table}_clean RENAME TO {table};")
+    con.execute("COMMIT")
+
+# Clean only rows loaded after the table's watermark batch: drop rule violations, then drop rows that duplicate
+# an already-cleaned row (fingerprint anti-join) or an earlier row of the same new batch
+def clean_new_batches(con, table, watermark):
+    start = time.perf_counter()
+    trip_columns = ', '.join(TRIP_COLUMNS)
+
+    rows_in = con.execute(f"SELECT COUNT(*) FROM {table} WHERE load_batch_id > ?;", [watermark]).fetchone()[0]
+    if rows_in == 0:
+        return 0, 0, time.perf_counter() - start
+
+    con.execute("BEGIN TRANSACTION")
+    con.execute(f"""
+        -- Remove new 0 passenger, 0 mile, >100 mile and >1 day trips (see quality.py)
+        DELETE FROM {table}
+        WHERE load_batch_id > ? AND NOT coalesce({keep_predicate()}, false);
+    """, [watermark])
+    con.execute(f"""
+        -- Remove new rows that repeat a cleaned row or an earlier new row
+        DELETE FROM {table}
+        WHERE rowid IN (
+            WITH new_rows AS (
+                SELECT rowid AS row_id, row_fingerprint, {trip_columns}
+                FROM {table}
+                WHERE load_batch_id > ?
+            ),
+            -- Cleaned rows are only read within the new rows' pickup range, which the month-ordered layout prunes
+            cleaned AS (
+                SELECT row_fingerprint, {trip_columns}
+                FROM {table}
+                WHERE load_batch_id <= ?
+                  AND pickup_time BETWEEN (SELECT MIN(pickup_time) FROM new_rows)
+                                      AND (SELECT MAX(pickup_time) FROM new_rows)
+            )
+            SELECT row_id FROM new_rows
+            SEMI JOIN cleaned USING (row_fingerprint, {trip_columns})
+            UNION ALL
+            SELECT row_id FROM (
+                SELECT row_id, row_number() OVER (PARTITION BY row_fingerprint, {trip_columns} ORDER BY row_id) AS copy
+                FROM new_rows
+            )
+            WHERE copy > 1
+        );
+    """, [watermark, watermark])
+    rows_out = con.execute(f"SELECT COUNT(*) FROM {table} WHERE load_batch_id > ?;", [watermark]).fetchone()[0]
+    con.execute("COMMIT")
+    return rows_in, rows_out, time.perf_counter() - start
 
-    con = None  # Placeholder for DuckDB connection
+# Function to clean taxi data tables prior to transformation and analysis
+# (parallelism partitions are cleaned at once, by default the resource profile's partitions; an explicit
+#  partition_memory_mb caps DuckDB memory at that much per partition instead of the profile's memory_limit)
+# (only newly loaded batches are cleaned unless full is set or the table has never been cleaned)
+# (colors limits the clean to some taxi colors, as parallel.py does with one database per color)
+# (con lets pipeline.py run the clean on its shared connection, in which case errors are re-raised to it,
+#  and resolved passes the resource settings it was opened with, so its profile's partitions are used)
+def clean(parallelism = None, partition_memory_mb = None, full = False, con = None, colors = ('yellow', 'green'),
+          resolved = None):
+
+    shared = con is not None  # Use the caller's connection if given
+    memory_limit = None       # Memory limit in effect before a per-partition cap
 
     # Try to connect to DuckDB and clean tables
     try:
         # Connect to local DuckDB instance (read/write mode)
-        con = duckdb.connect(database = 'emissions.duckdb', read_only = False)
+        # (memory, threads and the spill directory come from the resource profile)
+        resolved = resolved or settings()
+        con = con or connect(resolved = resolved)
+        parallelism = parallelism or resolved['partitions']
 
-        # Ensure temporary directory exists for DuckDB operations
-        os.makedirs("tmp", exist_ok = True)
-        con.execute("PRAGMA temp_directory='tmp';")
+        # Cap memory at one partition's budget per concurrent worker (restored below, since the connection may be shared)
+        if partition_memory_mb:
+            memory_limit = con.execute("SELECT current_setting('memory_limit');").fetchone()[0]
+            con.execute(f"SET memory_limit = '{partition_memory_mb * parallelism}MB';")
 
         print("Connected to DuckDB instance")
         logger.info("Connected to DuckDB instance")
 
-        # Loop through taxi data tables (yellow and green) individually
-        for table in ["yellow_taxi_data", "green_taxi_data"]:
+        # Identifier for this run's rows in dq_results
+        run_id = str(uuid.uuid4())
 
-            # Perform all cleaning in a single query
-            con.execute(f"""
-                CREATE OR REPLACE TABLE {table} AS
-                SELECT DISTINCT *
-                FROM {table}
-                WHERE passenger_count > 0                       -- Remove trips with 0 passengers
-                  AND trip_distance > 0                         -- Remove trips of 0 miles
-                  AND trip_distance <= 100                      -- Remove trips longer than 100 miles
-                  AND date_diff('seconds', pickup_time, dropoff_time) <= 86400;  -- Remove trips longer than 1 day
-            """)
-            print(f"Cleaned {table} in one pass")
-            logger.info(f"Cleaned {table} in one pass")
+        # Highest load batch already cleaned for each table
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS clean_watermark (
+                table_name VARCHAR PRIMARY KEY,
+                load_batch_id BIGINT,
+                cleaned_at TIMESTAMP);
+        """)
+
+        # Loop through taxi data tables (yellow and green) individually
+        for table in [f"{color}_taxi_data" for color in colors]:
+
+            watermark = con.execute(
+                "SELECT load_batch_id FROM clean_watermark WHERE table_name = ?;", [table]
+            ).fetchone()
+            latest = con.execute(f"SELECT COALESCE(MAX(load_batch_id), 0) FROM {table};").fetchone()[0]
+
+            if full or watermark is None:
+                # Filter and deduplicate one pickup month at a time (duplicates are judged on trip columns, not source_month)
+                print(f"Cleaning {table} by pickup month:")
+                logger.info(f"Cleaning {table} by pickup month:")
+                clean_partitioned(con, table, parallelism)
+            else:
+                # Only rows from batches loaded since the last clean need filtering and deduplicating
+                rows_in, rows_out, seconds = clean_new_batches(con, table, watermark[0])
+                print(f"Cleaning {table} batches after {watermark[0]}: {rows_in} rows in, {rows_out} rows out, {seconds:.2f}s")
+                logger.info(f"Cleaning {table} batches after {watermark[0]}: {rows_in} rows in, {rows_out} rows out, {seconds:.2f}s")
+            con.execute(
+                "INSERT OR REPLACE INTO clean_watermark VALUES (?, ?, current_timestamp);", [table, latest]
+            )
+            print(f"Cleaned {table}")
+            logger.info(f"Cleaned {table}")
 
             print(f"Confirmations for {table}:")
             logger.info(f"Confirmation for {table}:")
 
-            # Confirm no duplicates remain
-            num_dupes = con.execute(f"""
-                -- Get total number of rows
-                SELECT COUNT(*)
-                FROM {table};
-            """).fetchone()[0] - con.execute(f"""
-                -- Get number of distinct rows; subtraction gives duplicates
-                SELECT COUNT(*)
-                FROM (SELECT DISTINCT * FROM {table})                             
-            """).fetchone()[0]
-            print(f"\tNumber of duplicate rows: {num_dupes}")
-            logger.info(f"\tNumber of duplicate rows: {num_dupes}")
-
-            # Confirm no trips with 0 passengers
-            no_pass_count = con.execute(f"""
-                -- Count rows with 0 passengers
-                SELECT COUNT(*) FROM {table}
-                WHERE passenger_count == 0;
-            """).fetchone()[0]
-            print(f"\tNumber of trips with 0 passengers: {no_pass_count}")
-            logger.info(f"\tNumber of trips with 0 passengers: {no_pass_count}")
-
-            # Confirm no trips of 0 miles in length
-            num_0 = con.execute(f"""
-                -- Count rows with trip distance of 0
-                SELECT COUNT(*) FROM {table}
-                WHERE trip_distance == 0;                   
-            """).fetchone()[0]
-            print(f"\tNumber of trips of 0 miles in length: {num_0}")
-            logger.info(f"\tNumber of trips of 0 miles in length: {num_0}")
-
-            # Confirm no trips longer than 100 miles
-            num_over_100 = con.execute(f"""
-                -- Count rows with trip distance > 100
-                SELECT COUNT(*) FROM {table}
-                WHERE trip_distance > 100;   
-            """).fetchone()[0]
-            print(f"\tNumber of trips > 100 miles in length: {num_over_100}")
-            logger.info(f"\tNumber of trips > 100 miles in length: {num_over_100}")
-
-            # Confirm no trips lasting longer than a day
-            num_over_day = con.execute(f"""
-                -- Count rows with trip duration > 86400 seconds (1 day)
-                SELECT COUNT(*) FROM {table}
-                WHERE date_diff('seconds', pickup_time, dropoff_time) > 86400;
-            """).fetchone()[0]
-            print(f"\tNumber of trips lasting over a day: {num_over_day}")
-            logger.info(f"\tNumber of trips lasting over a day: {num_over_day}")
+            # Confirm no duplicates or rule violations remain, checking every rule in a single scan
+            for _, label, count in verify(con, table, run_id):
+                print(f"\t{label}: {count}")
+                logger.info(f"\t{label}: {count}")
+
+        print(telemetry(con))
+        logger.info(telemetry(con))
 
         print(f"clean.py script is complete")
         logger.info(f"clean.py script is complete")
@@ -103,6 +191,13 @@ def clean():
     except Exception as e:
         print(f"An error occurred: {e}")
         logger.error(f"An error occurred: {e}")
+        if shared:
+            raise
+
+    # Put back the memory limit the connection had before cleaning
+    finally:
+        if memory_limit is not None:
+            con.execute(f"SET memory_limit = '{memory_limit}';")
 
 
 # Run the cleaning function if script is executed directly
@@ -0,0 +1,13 @@
+{% macro rebuilt_months(color) %}
+-- Pickup months of a color's final table holding rows from any source file loaded after this model's watermark
+-- for that color (the same months the final table just rebuilt)
+pickup_month IN (
+    SELECT pickup_month
+    FROM {{ ref('final_' ~ color ~ '_data') }}
+    WHERE source_month IN (
+        SELECT source_month
+        FROM {{ ref('final_' ~ color ~ '_data') }}
+        WHERE load_batch_id > (SELECT COALESCE(MAX(load_batch_id), 0) FROM {{ this }} WHERE color = '{{ color }}')
+    )
+)
+{% endmacro %}
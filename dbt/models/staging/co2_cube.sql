@@ -0,0 +1,55 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['color', 'year', 'month_of_year']
+) }}
+
+-- CO2 and speed rollup by color and pickup calendar cell; small enough for analysis.py to answer every question from.
+-- Incremental runs re-aggregate only the (color, year, month) cells of months the final tables just rebuilt
+SELECT
+    'yellow' AS color,
+    EXTRACT(YEAR FROM pickup_time) AS year,
+    month_of_year,
+    week_of_year,
+    day_of_week,
+    hour_of_day,
+    COUNT(trip_co2_kgs) AS trip_count,
+    SUM(trip_co2_kgs) AS sum_co2_kgs,
+    MIN(trip_co2_kgs) AS min_co2_kgs,
+    MAX(trip_co2_kgs) AS max_co2_kgs,
+    COUNT(avg_mph) AS mph_count,
+    SUM(avg_mph) AS sum_avg_mph,
+    MIN(avg_mph) AS min_avg_mph,
+    MAX(avg_mph) AS max_avg_mph,
+    MAX(load_batch_id) AS load_batch_id
+FROM
+    {{ ref('final_yellow_data') }}
+{% if is_incremental() %}
+WHERE {{ rebuilt_months('yellow') }}
+{% endif %}
+GROUP BY ALL
+
+UNION ALL
+
+SELECT
+    'green' AS color,
+    EXTRACT(YEAR FROM pickup_time) AS year,
+    month_of_year,
+    week_of_year,
+    day_of_week,
+    hour_of_day,
+    COUNT(trip_co2_kgs) AS trip_count,
+    SUM(trip_co2_kgs) AS sum_co2_kgs,
+    MIN(trip_co2_kgs) AS min_co2_kgs,
+    MAX(trip_co2_kgs) AS max_co2_kgs,
+    COUNT(avg_mph) AS mph_count,
+    SUM(avg_mph) AS sum_avg_mph,
+    MIN(avg_mph) AS min_avg_mph,
+    MAX(avg_mph) AS max_avg_mph,
+    MAX(load_batch_id) AS load_batch_id
+FROM
+    {{ ref('final_green_data') }}
+{% if is_incremental() %}
+WHERE {{ rebuilt_months('green') }}
+{% endif %}
+GROUP BY ALL
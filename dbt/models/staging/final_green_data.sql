@@ -1,4 +1,27 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='pickup_month'
+) }}
 
-SELECT *
-FROM {{ref('green_month')}}
\ No newline at end of file
+SELECT
+    *,
+    DATE_TRUNC('month', pickup_time) AS pickup_month
+FROM {{ref('green_month')}}
+{% if is_incremental() %}
+-- Only rebuild pickup months touched by load batches newer than this table's watermark
+-- (months of new rows, plus months already built from any source file that was reloaded)
+WHERE DATE_TRUNC('month', pickup_time) IN (
+    SELECT DATE_TRUNC('month', pickup_time)
+    FROM green_taxi_data
+    WHERE load_batch_id > (SELECT COALESCE(MAX(load_batch_id), 0) FROM {{ this }})
+    UNION
+    SELECT pickup_month
+    FROM {{ this }}
+    WHERE source_month IN (
+        SELECT source_month
+        FROM green_taxi_data
+        WHERE load_batch_id > (SELECT COALESCE(MAX(load_batch_id), 0) FROM {{ this }})
+    )
+)
+{% endif %}
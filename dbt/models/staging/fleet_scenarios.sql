@@ -0,0 +1,64 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['color', 'year', 'month_of_year']
+) }}
+
+-- CO2 for every vehicle_type as if it carried each color's trips. CO2 is distance times a per-vehicle factor,
+-- so one scan for miles per (color, year, month) serves every scenario. Pass a CSV with the vehicle_emissions
+-- columns as --vars '{scenario_csv: path/to/scenarios.csv}' to model other fleets (with --full-refresh, since
+-- incremental runs only recompute months the final tables just rebuilt).
+WITH monthly_miles AS (
+    SELECT
+        'yellow' AS color,
+        EXTRACT(YEAR FROM pickup_time) AS year,
+        month_of_year,
+        COUNT(*) AS trip_count,
+        SUM(trip_distance) AS total_miles,
+        MAX(load_batch_id) AS load_batch_id
+    FROM {{ ref('final_yellow_data') }}
+    {% if is_incremental() %}
+    WHERE {{ rebuilt_months('yellow') }}
+    {% endif %}
+    GROUP BY ALL
+
+    UNION ALL
+
+    SELECT
+        'green' AS color,
+        EXTRACT(YEAR FROM pickup_time) AS year,
+        month_of_year,
+        COUNT(*) AS trip_count,
+        SUM(trip_distance) AS total_miles,
+        MAX(load_batch_id) AS load_batch_id
+    FROM {{ ref('final_green_data') }}
+    {% if is_incremental() %}
+    WHERE {{ rebuilt_months('green') }}
+    {% endif %}
+    GROUP BY ALL
+),
+
+scenarios AS (
+{% if var('scenario_csv', none) %}
+    SELECT vehicle_type, fuel_type, co2_grams_per_mile
+    FROM read_csv('{{ var("scenario_csv") }}')
+{% else %}
+    SELECT vehicle_type, fuel_type, co2_grams_per_mile
+    FROM vehicle_emissions
+{% endif %}
+)
+
+SELECT
+    monthly_miles.color,
+    monthly_miles.year,
+    monthly_miles.month_of_year,
+    scenarios.vehicle_type AS scenario,
+    scenarios.fuel_type,
+    scenarios.vehicle_type = monthly_miles.color || '_taxi' AS is_baseline,
+    monthly_miles.trip_count,
+    monthly_miles.total_miles,
+    (monthly_miles.total_miles * scenarios.co2_grams_per_mile) / 1000 AS total_co2_kgs,
+    monthly_miles.load_batch_id
+FROM
+    monthly_miles
+CROSS JOIN scenarios
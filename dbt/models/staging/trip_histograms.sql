@@ -0,0 +1,68 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['color', 'year', 'month']
+) }}
+
+-- Fixed-bin histograms of trip CO2, distance and speed per color and pickup (year, month, hour); bins are the same
+-- in every partition, so any range's histogram is the sum of its partitions' counts.
+-- Each metric has [low, high, bins] equal-width bins, plus bin 0 below low and bin bins + 1 at or above high
+{% set histogram_bins = var('histogram_bins', {
+    'trip_co2_kgs': [0, 20, 100],
+    'trip_distance': [0, 100, 100],
+    'avg_mph': [0, 80, 80],
+}) %}
+
+WITH trips AS (
+    {% for color in ['yellow', 'green'] %}
+    SELECT
+        '{{ color }}' AS color,
+        EXTRACT(YEAR FROM pickup_time) AS year,
+        month_of_year AS month,
+        hour_of_day,
+        trip_co2_kgs,
+        trip_distance,
+        avg_mph,
+        load_batch_id
+    FROM {{ ref('final_' ~ color ~ '_data') }}
+    {% if is_incremental() %}
+    WHERE {{ rebuilt_months(color) }}
+    {% endif %}
+    {% if not loop.last %}UNION ALL{% endif %}
+    {% endfor %}
+),
+metric_values AS (
+    UNPIVOT trips
+    ON trip_co2_kgs, trip_distance, avg_mph
+    INTO NAME metric VALUE value
+),
+bins (metric, low, high, bins) AS (
+    VALUES
+    {% for metric, (low, high, bins) in histogram_bins.items() %}
+        ('{{ metric }}', {{ low }}::DOUBLE, {{ high }}::DOUBLE, {{ bins }}){% if not loop.last %},{% endif %}
+    {% endfor %}
+),
+binned AS (
+    SELECT
+        color, year, month, hour_of_day, metric, low, high, bins, load_batch_id,
+        CASE WHEN value < low THEN 0
+             WHEN value >= high THEN bins + 1
+             ELSE 1 + CAST(floor((value - low) / ((high - low) / bins)) AS INTEGER)
+        END AS bin
+    FROM metric_values
+    JOIN bins USING (metric)
+    WHERE isfinite(value)
+)
+SELECT
+    color,
+    year,
+    month,
+    hour_of_day,
+    metric,
+    bin,
+    CASE WHEN bin > 0 THEN low + (bin - 1) * (high - low) / bins END AS bin_low,
+    CASE WHEN bin <= bins THEN low + bin * (high - low) / bins END AS bin_high,
+    COUNT(*) AS count,
+    MAX(load_batch_id) AS load_batch_id
+FROM binned
+GROUP BY ALL
@@ -0,0 +1,50 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['color', 'year', 'month']
+) }}
+
+-- Mergeable quantile sketches of trip CO2, distance and speed per color and pickup (year, month, hour).
+-- Each value is counted in a log-spaced bucket of width gamma = (1 + a) / (1 - a) (a DDSketch), so summing bucket
+-- counts over any set of partitions gives quantiles within relative accuracy a of the true values
+-- (non-positive values share bucket NULL and are read back as 0)
+{% set relative_accuracy = var('sketch_relative_accuracy', 0.01) %}
+
+WITH trips AS (
+    {% for color in ['yellow', 'green'] %}
+    SELECT
+        '{{ color }}' AS color,
+        EXTRACT(YEAR FROM pickup_time) AS year,
+        month_of_year AS month,
+        hour_of_day,
+        trip_co2_kgs,
+        trip_distance,
+        avg_mph,
+        load_batch_id
+    FROM {{ ref('final_' ~ color ~ '_data') }}
+    {% if is_incremental() %}
+    WHERE {{ rebuilt_months(color) }}
+    {% endif %}
+    {% if not loop.last %}UNION ALL{% endif %}
+    {% endfor %}
+),
+metric_values AS (
+    UNPIVOT trips
+    ON trip_co2_kgs, trip_distance, avg_mph
+    INTO NAME metric VALUE value
+)
+SELECT
+    color,
+    year,
+    month,
+    hour_of_day,
+    metric,
+    (1 + {{ relative_accuracy }}) / (1 - {{ relative_accuracy }}) AS gamma,
+    CASE WHEN value > 0
+         THEN CAST(ceil(ln(value) / ln((1 + {{ relative_accuracy }}) / (1 - {{ relative_accuracy }}))) AS INTEGER)
+    END AS bucket,
+    COUNT(*) AS count,
+    MAX(load_batch_id) AS load_batch_id
+FROM metric_values
+WHERE isfinite(value)
+GROUP BY ALL
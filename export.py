@@ -0,0 +1,127 @@
+# Imports
+import logging       # For logging messages and errors
+import os            # For filesystem operations
+import shutil        # For clearing a previous export
+from resources import connect, telemetry  # Connections with the project's resource settings
+
+# Initializing logger
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'export.log'                              # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+# Directory the compact parquet copy of the final tables is written to
+EXPORT_DIR = 'export'
+
+# Columns of the final tables narrowed to the smallest type that holds them
+# (trip_distance and trip_co2_kgs stay DOUBLE so analysis results do not change)
+COMPACT_COLUMNS = """
+    pickup_time,
+    dropoff_time,
+    CAST(passenger_count AS UTINYINT) AS passenger_count,
+    trip_distance,
+    trip_co2_kgs,
+    CAST(avg_mph AS FLOAT) AS avg_mph,
+    CAST(hour_of_day AS UTINYINT) AS hour_of_day,
+    CAST(day_of_week AS UTINYINT) AS day_of_week,
+    CAST(week_of_year AS UTINYINT) AS week_of_year,
+    CAST(month_of_year AS UTINYINT) AS month_of_year
+"""
+
+# Directory holding a color's hive-partitioned files
+def color_dir(export_dir, color):
+    return os.path.join(os.path.abspath(export_dir), f'color={color}')
+
+# Total size in bytes of all files under a directory
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+# Exported files whose rows are not in pickup_time order (zone maps only prune sorted files well)
+def unsorted_files(con, path):
+    return [row[0] for row in con.execute(f"""
+        SELECT filename
+        FROM (
+            SELECT filename, pickup_time < lag(pickup_time) OVER (PARTITION BY filename ORDER BY file_row_number) AS out_of_order
+            FROM read_parquet('{path}/*/*/*.parquet', filename = true, file_row_number = true)
+        )
+        GROUP BY filename
+        HAVING bool_or(out_of_order)
+        ORDER BY filename;
+    """).fetchall()]
+
+# Function to export the final tables as sorted, zstd-compressed parquet partitioned by color/year/month,
+# with views in DuckDB so the export can be queried like the tables
+def export(export_dir = EXPORT_DIR):
+
+    con = None  # Placeholder for DuckDB connection
+
+    # Try to connect to DuckDB and export tables
+    try:
+        # Connect to local DuckDB instance (read/write mode)
+        # (memory, threads and the spill directory come from the resource profile)
+        con = connect()
+        print("Connected to DuckDB instance")
+        logger.info("Connected to DuckDB instance")
+
+        for color in ['yellow', 'green']:
+            table = f'final_{color}_data'
+            path = color_dir(export_dir, color)
+
+            # Replace any previous export of this color
+            shutil.rmtree(path, ignore_errors = True)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+
+            # Sorting by pickup time gives each row group a tight time range, so date-bounded scans skip most of them.
+            # A partitioned COPY does not keep the ORDER BY within each file, so every month is written by its own COPY
+            months = con.execute(f"""
+                SELECT DISTINCT EXTRACT(YEAR FROM pickup_time) AS year, EXTRACT(MONTH FROM pickup_time) AS month
+                FROM {table}
+                WHERE pickup_time IS NOT NULL
+                ORDER BY ALL;
+            """).fetchall()
+            for year, month in months:
+                os.makedirs(os.path.join(path, f'year={year}', f'month={month}'))
+                con.execute(f"""
+                    COPY (
+                        SELECT {COMPACT_COLUMNS}
+                        FROM {table}
+                        WHERE pickup_time >= make_timestamp({year}, {month}, 1, 0, 0, 0)
+                          AND pickup_time < make_timestamp({year}, {month}, 1, 0, 0, 0) + INTERVAL 1 MONTH
+                        ORDER BY pickup_time
+                    ) TO '{os.path.join(path, f'year={year}', f'month={month}', 'data_0.parquet')}' (FORMAT parquet, COMPRESSION zstd);
+                """)
+
+            unsorted = unsorted_files(con, path)
+            if unsorted:
+                raise RuntimeError(f"Exported files not sorted by pickup_time: {', '.join(unsorted)}")
+
+            # View with the same columns as the table, plus the year/month partition keys for pruning
+            con.execute(f"""
+                CREATE OR REPLACE VIEW {table}_compact AS
+                SELECT *
+                FROM read_parquet('{path}/*/*/*.parquet', hive_partitioning = true);
+            """)
+
+            # Report the export's footprint
+            exported = dir_size(path)
+            rows = con.execute(f"SELECT COUNT(*) FROM {table}_compact;").fetchone()[0]
+            print(f"Exported {rows} rows of {table} to {path} ({exported / 1e6:.1f} MB), view {table}_compact")
+            logger.info(f"Exported {rows} rows of {table} to {path} ({exported / 1e6:.1f} MB), view {table}_compact")
+
+        print(telemetry(con))
+        logger.info(telemetry(con))
+
+        print("export.py script is complete")
+        logger.info("export.py script is complete")
+
+    # Handle any errors during export
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
+
+
+# Run the export function if script is executed directly
+if __name__ == "__main__":
+    export()
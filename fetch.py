@@ -0,0 +1,284 @@
+# Imports
+import fcntl         # For locking the mirror index across processes
+import hashlib       # For content-addressing downloaded files
+import json          # For reading/writing the mirror index
+import logging       # For logging messages and errors
+import os            # For filesystem operations
+import random        # For jitter in retry backoff
+import shutil        # For copying files from a local source directory
+import threading     # For the rate limiter and index locks
+import time          # For rate limiting and backoff delays
+import urllib.error  # For HTTP error handling
+import urllib.parse  # For telling URLs apart from local paths
+import urllib.request  # For downloading files over HTTP
+from concurrent.futures import ThreadPoolExecutor, as_completed  # For the bounded worker pool
+
+# Logger instance (configured by whichever script is being run)
+logger = logging.getLogger(__name__)
+
+# Where trip files come from and where the local mirror lives (override with environment variables)
+BASE_URL = os.environ.get('TLC_BASE_URL', 'https://d37ci6vzurychx.cloudfront.net/trip-data')
+MIRROR_DIR = os.environ.get('TLC_MIRROR_DIR', 'mirror')
+
+# HTTP status codes worth retrying (CloudFront answers 403 when throttling)
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+
+# Size of each chunk read while downloading/hashing
+CHUNK_SIZE = 1024 * 1024
+
+
+# Token-bucket rate limiter shared by all download workers
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = rate              # Tokens added per second
+        self.capacity = capacity      # Maximum burst size
+        self.tokens = capacity        # Start with a full bucket
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until a token is available, then take it
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Build the file name the TLC uses for a color/year/month
+def source_name(color, year, month):
+    return f'{color}_tripdata_{year}-{month}.parquet'
+
+
+# Join a base URL (or local directory) with a file name
+def source_url(base_url, name):
+    if urllib.parse.urlparse(base_url).scheme in ('http', 'https', 'file'):
+        return f"{base_url.rstrip('/')}/{name}"
+    return os.path.join(base_url, name)
+
+
+# Compute the sha256 of a file on disk
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Local mirror of downloaded files, stored by content hash with a name -> hash index
+class Mirror:
+
+    def __init__(self, mirror_dir):
+        self.mirror_dir = mirror_dir
+        self.index_path = os.path.join(mirror_dir, 'index.json')
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(mirror_dir, 'objects'), exist_ok = True)
+        os.makedirs(os.path.join(mirror_dir, 'partial'), exist_ok = True)
+
+        # Load the existing index from a previous run, if any
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    # Path of a stored object for a given hash
+    def object_path(self, sha256):
+        return os.path.join(self.mirror_dir, 'objects', sha256[:2], f'{sha256}.parquet')
+
+    # Path of an in-progress download for a given name
+    def partial_path(self, name):
+        return os.path.join(self.mirror_dir, 'partial', f'{name}.part')
+
+    # Return the index entry for a name if its object is still on disk
+    def lookup(self, name):
+        entry = self.index.get(name)
+        if entry and os.path.exists(self.object_path(entry['sha256'])):
+            return entry
+        return None
+
+    # Move a finished download into the object store and record it in the index
+    def store(self, name, tmp_path, url, etag):
+        sha256 = sha256_file(tmp_path)
+        path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        os.replace(tmp_path, path)
+        entry = {
+            'sha256': sha256,
+            'size': os.path.getsize(path),
+            'etag': etag,
+            'url': url,
+            'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with self.lock:
+            self._save(name, entry)
+        return entry
+
+    # Add an entry to the index on disk, merging entries stored meanwhile by other processes sharing the mirror,
+    # and write it atomically so an interrupted run never leaves it half-written
+    def _save(self, name, entry):
+        with open(os.path.join(self.mirror_dir, 'index.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    self.index.update(json.load(f))
+            self.index[name] = entry
+            tmp = f'{self.index_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f, indent = 2, sort_keys = True)
+            os.replace(tmp, self.index_path)
+
+
+# Download one URL into a partial file, resuming from where a previous attempt stopped.
+# The partial's ETag is kept beside it and sent as If-Range, so a file that changed upstream
+# is downloaded again in full instead of being spliced onto the old bytes
+def _download(url, part_path, etag = None):
+    headers = {'User-Agent': 'ds3022-taxi-co2'}
+    etag_path = f'{part_path}.etag'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    part_etag = None
+    if offset and os.path.exists(etag_path):
+        with open(etag_path) as f:
+            part_etag = f.read().strip() or None
+    if offset and part_etag:
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = part_etag
+    else:
+        offset = 0  # No validator for the partial, so it can't be safely resumed
+    if etag:
+        headers['If-None-Match'] = etag
+
+    request = urllib.request.Request(url, headers = headers)
+    try:
+        response = urllib.request.urlopen(request, timeout = 60)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None  # Not modified since the mirrored copy
+        if e.code == 416:
+            # Range not satisfiable: the partial file is stale, start over
+            os.remove(part_path)
+            return _download(url, part_path, etag)
+        raise
+
+    with response:
+        # Server ignored the Range header or the file changed (If-Range failed), so restart from the beginning
+        mode = 'ab' if offset and response.status == 206 else 'wb'
+        if mode == 'wb':
+            with open(etag_path, 'w') as f:
+                f.write(response.headers.get('ETag') or '')
+        with open(part_path, mode) as f:
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+        if os.path.exists(etag_path):
+            os.remove(etag_path)
+        return response.headers.get('ETag')
+
+
+# Fetch a single file into the mirror (retrying throttled/server errors) and return its index entry
+def fetch_file(name, base_url, mirror, bucket, retries = 5, backoff = 2.0, refresh = False):
+    url = source_url(base_url, name)
+
+    # Reuse the mirrored copy unless asked to check the source for changes
+    entry = mirror.lookup(name)
+    if entry and not refresh:
+        return dict(entry, name = name, path = mirror.object_path(entry['sha256']), cached = True)
+
+    part_path = mirror.partial_path(name)
+
+    # Local directory source: copy the file (changed content gets a new hash)
+    if urllib.parse.urlparse(url).scheme not in ('http', 'https', 'file'):
+        if entry and entry['size'] == os.path.getsize(url) and entry['sha256'] == sha256_file(url):
+            return dict(entry, name = name, path = mirror.object_path(entry['sha256']), cached = True)
+        shutil.copyfile(url, part_path)
+        entry = mirror.store(name, part_path, url, None)
+        return dict(entry, name = name, path = mirror.object_path(entry['sha256']), cached = False)
+
+    # Remote source: rate-limited download with exponential backoff on retryable errors
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            etag = _download(url, part_path, entry['etag'] if entry else None)
+            if etag is None and entry:
+                return dict(entry, name = name, path = mirror.object_path(entry['sha256']), cached = True)
+            entry = mirror.store(name, part_path, url, etag)
+            return dict(entry, name = name, path = mirror.object_path(entry['sha256']), cached = False)
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES or attempt == retries:
+                raise
+            error = e
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            if attempt == retries:
+                raise
+            error = e
+
+        # Exponential backoff with jitter before the next attempt
+        delay = backoff * (2 ** attempt) * (0.5 + random.random())
+        logger.warning(f"Retrying {name} in {delay:.1f}s after error: {error}")
+        time.sleep(delay)
+
+
+# Fetch every color/year/month file into the local mirror using a bounded worker pool;
+# returns the fetched files and the ones that failed (with their error), so callers can carry on without them
+def fetch(colors, years, months, base_url = None, mirror_dir = None, workers = 4, rate = 2.0,
+          burst = 4, retries = 5, backoff = 2.0, refresh = False):
+
+    base_url = base_url or BASE_URL
+    mirror = Mirror(mirror_dir or MIRROR_DIR)
+    bucket = TokenBucket(rate, burst)
+
+    # Every file we need, keyed by name so results can be matched back to color/year/month
+    wanted = {source_name(c, y, m): (c, y, m) for c in colors for y in years for m in months}
+
+    results = []
+    failures = []
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = {
+            pool.submit(fetch_file, name, base_url, mirror, bucket, retries, backoff, refresh): name
+            for name in wanted
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                color, year, month = wanted[name]
+                failures.append({'name': name, 'color': color, 'year': year, 'month': month,
+                                 'path': source_url(base_url, name), 'error': str(e)})
+                logger.error(f"Failed to fetch {name}: {e}")
+                continue
+            color, year, month = wanted[name]
+            result.update(color = color, year = year, month = month)
+            results.append(result)
+            logger.info(f"{'Mirrored' if result['cached'] else 'Downloaded'} {name} ({result['size']} bytes)")
+
+    # Completed files stay in the mirror, so a re-run resumes with only the failures
+    if failures:
+        logger.warning(f"Failed to fetch {len(failures)} file(s): {', '.join(sorted(f['name'] for f in failures))}")
+
+    return (sorted(results, key = lambda r: (r['color'], r['year'], r['month'])),
+            sorted(failures, key = lambda f: (f['color'], f['year'], f['month'])))
+
+
+# Fetch all files into the mirror if script is executed directly
+if __name__ == "__main__":
+    logging.basicConfig(
+        level = logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+        filename = 'fetch.log'                               # Log output file
+    )
+    years = [str(y) for y in range(2015, 2025)]
+    months = [f'{m:02d}' for m in range(1, 13)]
+    try:
+        files, failures = fetch(['yellow', 'green'], years, months)
+        print(f"Fetched {len(files)} files into {MIRROR_DIR}")
+        logger.info(f"Fetched {len(files)} files into {MIRROR_DIR}")
+        if failures:
+            print(f"Failed to fetch {len(failures)} file(s): {', '.join(f['name'] for f in failures)}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
@@ -1,8 +1,10 @@
 # Imports
-import duckdb        # For interacting with DuckDB databases
-import os            # For filesystem operations
+import argparse      # For command-line options
+import datetime      # For matching manifest months to loaded rows
 import logging       # For logging messages and errors
-import time          # For adding delays between requests to avoid 403 errors
+from fetch import fetch  # For downloading trip files into the local mirror
+from quality import keep_predicate, rule_flags, rejection_counts, fingerprint, CLEAN_RULES  # Cleaning rules and row fingerprints
+from resources import connect, telemetry  # Connections with the project's resource settings
 
 # Initializing logger
 logging.basicConfig(
@@ -12,101 +14,325 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)  # Create a logger instance
 
+# Column prefixes differ between yellow (tpep) and green (lpep) files
+PREFIXES = {'yellow': 'tpep', 'green': 'lpep'}
+
+# Target schema of the taxi tables, used for explicit casts during ingest
+TARGET_TYPES = {
+    'pickup_time': 'TIMESTAMP',
+    'dropoff_time': 'TIMESTAMP',
+    'passenger_count': 'INTEGER',
+    'trip_distance': 'DOUBLE',
+}
+
+# Source column name in the parquet files for each target column
+def source_columns(color):
+    return {
+        'pickup_time': f'{PREFIXES[color]}_pickup_datetime',
+        'dropoff_time': f'{PREFIXES[color]}_dropoff_datetime',
+        'passenger_count': 'passenger_count',
+        'trip_distance': 'trip_distance',
+    }
+
+# Read a file's schema and map each target column to its (source column, source type); raises if one is missing
+def column_mapping(con, color, path):
+    described = {
+        name.lower(): (name, col_type)
+        for name, col_type, *_ in con.execute("DESCRIBE SELECT * FROM read_parquet(?)", [path]).fetchall()
+    }
+    mapping = {}
+    for target, source in source_columns(color).items():
+        if source not in described:
+            raise ValueError(f"missing column {source}")
+        mapping[target] = described[source]
+    return mapping
+
+# Record a file that could not be loaded so the rest of the run can continue
+def quarantine(con, f, error):
+    con.execute("""
+        -- Record the failing file; it is retried on the next run since it is not in the manifest
+        INSERT OR REPLACE INTO load_quarantine
+        VALUES (?, ?, ?, ?, ?, current_timestamp);
+    """, [f['color'], int(f['year']), int(f['month']), f['path'], str(error)])
+    print(f"Quarantined {f['color']} taxi data for {f['month']}/{f['year']}: {error}")
+    logger.warning(f"Quarantined {f['color']} taxi data for {f['month']}/{f['year']}: {error}")
+
+# Load a batch of one color's files with a single multi-file scan, replacing any rows previously loaded for their months
+# (fused mode applies clean.py's rules inside the scan and records per-month rejection counts on each file)
+def ingest(con, color, files, load_batch_id, fused = False):
+    source = source_columns(color)
+
+    # Scan of the batch's files cast to the table schema, tagged with each row's source month
+    scan = f"""
+        SELECT
+            CAST(s.{source['pickup_time']} AS {TARGET_TYPES['pickup_time']}) AS pickup_time,
+            CAST(s.{source['dropoff_time']} AS {TARGET_TYPES['dropoff_time']}) AS dropoff_time,
+            CAST(s.passenger_count AS {TARGET_TYPES['passenger_count']}) AS passenger_count,
+            CAST(s.trip_distance AS {TARGET_TYPES['trip_distance']}) AS trip_distance,
+            f.source_month
+        FROM read_parquet(?, union_by_name = true, filename = true) AS s
+        JOIN ingest_files AS f ON s.filename = f.path
+    """
+    paths = [[f['path'] for f in files]]
+
+    # Small lookup of the batch's files so each scanned row can be tagged with its source month
+    con.execute("CREATE OR REPLACE TEMP TABLE ingest_files (path VARCHAR, source_month DATE)")
+    con.executemany("INSERT INTO ingest_files VALUES (?, make_date(?, ?, 1))",
+                    [[f['path'], int(f['year']), int(f['month'])] for f in files])
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"""
+            -- Remove rows previously loaded from these months' files
+            DELETE FROM {color}_taxi_data
+            WHERE source_month IN (SELECT source_month FROM ingest_files);
+        """)
+        # Insert data into the taxi table from every file in one scan, unifying drifted schemas by name;
+        # in fused mode the cleaning predicates are pushed down into the parquet scan
+        # (each row also gets a 64-bit fingerprint of its trip columns and this run's load batch id)
+        con.execute(f"""
+            INSERT INTO {color}_taxi_data BY NAME
+            SELECT *, {fingerprint()} AS row_fingerprint, {int(load_batch_id)} AS load_batch_id
+            FROM ({scan})
+            {'WHERE ' + keep_predicate() if fused else ''};
+        """, paths)
+
+        # Count the rows each cleaning rule rejected, per month, with an aggregate over the same scan
+        # (it only reads the four rule columns, and nothing is written)
+        rejected = {}
+        if fused:
+            rejected = {
+                row[0]: dict(zip([name for name, _ in CLEAN_RULES], row[1:]))
+                for row in con.execute(f"""
+                    SELECT source_month, {rejection_counts()}
+                    FROM (SELECT source_month, {rule_flags()} FROM ({scan}))
+                    GROUP BY source_month;
+                """, paths).fetchall()
+            }
+
+        # Row counts per month for the manifest (only the newly inserted months are read)
+        row_counts = dict(con.execute(f"""
+            SELECT source_month, COUNT(*)
+            FROM {color}_taxi_data
+            WHERE source_month IN (SELECT source_month FROM ingest_files)
+            GROUP BY source_month;
+        """).fetchall())
+
+        for f in files:
+            source_month = datetime.date(int(f['year']), int(f['month']), 1)
+            row_count = row_counts.get(source_month, 0)
+            con.execute("""
+                -- Record the loaded file in the manifest
+                INSERT OR REPLACE INTO load_manifest BY NAME
+                SELECT ? AS color, ? AS year, ? AS month, ? AS source, ? AS size, ? AS etag, ? AS sha256,
+                       ? AS row_count, current_timestamp AS loaded_at, ? AS load_batch_id;
+            """, [color, int(f['year']), int(f['month']), f['url'], f['size'], f['etag'], f['sha256'], row_count, load_batch_id])
+            con.execute("""
+                -- Clear any earlier quarantine of this file
+                DELETE FROM load_quarantine WHERE color = ? AND year = ? AND month = ?;
+            """, [color, int(f['year']), int(f['month'])])
+            f['row_count'] = row_count
+            f['rejected'] = rejected.get(source_month, {})
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
 # Function to load taxi and emissions data into DuckDB tables and display summary statistics
-def load():
+# (con lets pipeline.py run the load on its shared connection, in which case errors are re-raised to it;
+#  colors limits the load to some taxi colors, as parallel.py does with one database per color)
+def load(base_url = None, mirror_dir = None, workers = 4, rate = 2.0, refresh = False, bulk = True, fused = False, con = None,
+         colors = ('yellow', 'green')):
 
     # Define the years and months to process
     years = ['2015', '2016', '2017', '2018', '2019', '2020', '2021', '2022', '2023', '2024']
     months = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10', '11', '12']
 
-    # Initialize DuckDB connection placeholder
-    con = None
+    # Use the caller's connection if given
+    shared = con is not None
 
     # Try to load data into DuckDB
     try:
         # Connect to local DuckDB instance (read/write mode)
-        con = duckdb.connect(database = 'emissions.duckdb', read_only = False)
+        # (memory, threads and the spill directory come from the resource profile)
+        con = con or connect()
         print("Connected to DuckDB instance")
         logger.info("Connected to DuckDB instance")
 
-        # Drop tables if they exist from a previous run
-        con.execute(f"""
-            -- Drop the yellow taxi table if it exists
-            DROP TABLE IF EXISTS yellow_taxi_data;              
-
-            -- Drop the green taxi table if it exists
-            DROP TABLE IF EXISTS green_taxi_data;   
+        # Tables built before the manifest existed cannot be loaded incrementally, so rebuild them once
+        has_manifest = con.execute("""
+            -- Check whether a previous run recorded a load manifest
+            SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'load_manifest';
+        """).fetchone()[0]
+        if not has_manifest:
+            con.execute(f"""
+                -- Drop the yellow taxi table if it exists
+                DROP TABLE IF EXISTS yellow_taxi_data;              
 
-            -- Drop the vehicle_emissions table if it exists
-            DROP TABLE IF EXISTS vehicle_emissions;
-        """)
-        print("Dropped tables if they existed already")
-        logger.info("Dropped tables if they existed already")
+                -- Drop the green taxi table if it exists
+                DROP TABLE IF EXISTS green_taxi_data;   
+            """)
+            print("Dropped taxi tables from a run without a load manifest")
+            logger.info("Dropped taxi tables from a run without a load manifest")
         
-        # Create empty taxi tables with correct schema
+        # An earlier parallel.py replaced the final tables of emissions.duckdb with views onto per-color databases,
+        # listed in catalog_parts; drop them so the single-database pipeline can build its own tables again
+        has_catalog = con.execute("""
+            SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'catalog_parts' AND table_catalog = current_database();
+        """).fetchone()[0]
+        if has_catalog:
+            con.execute("""
+                DROP VIEW IF EXISTS final_yellow_data;
+                DROP VIEW IF EXISTS final_green_data;
+                DROP VIEW IF EXISTS vehicle_emissions;
+                DROP TABLE catalog_parts;
+            """)
+            print("Dropped the views of an earlier parallel.py run")
+            logger.info("Dropped the views of an earlier parallel.py run")
+
+        # Create taxi tables (if missing) with correct schema; source_month ties each row to its monthly file
         con.execute("""
-            -- Creating empty yellow taxi table
+            -- Creating yellow taxi table
             CREATE TABLE IF NOT EXISTS yellow_taxi_data (
                 pickup_time TIMESTAMP,
                 dropoff_time TIMESTAMP,
                 passenger_count INTEGER,
-                trip_distance DOUBLE);
+                trip_distance DOUBLE,
+                source_month DATE,
+                row_fingerprint UBIGINT,
+                load_batch_id BIGINT);
 
-            -- Creating empty green taxi table
+            -- Creating green taxi table
             CREATE TABLE IF NOT EXISTS green_taxi_data (
                 pickup_time TIMESTAMP,
                 dropoff_time TIMESTAMP,
                 passenger_count INTEGER,
-                trip_distance DOUBLE);
+                trip_distance DOUBLE,
+                source_month DATE,
+                row_fingerprint UBIGINT,
+                load_batch_id BIGINT);
+
+            -- Creating manifest of loaded monthly files
+            CREATE TABLE IF NOT EXISTS load_manifest (
+                color VARCHAR,
+                year INTEGER,
+                month INTEGER,
+                source VARCHAR,
+                size BIGINT,
+                etag VARCHAR,
+                sha256 VARCHAR,
+                row_count BIGINT,
+                loaded_at TIMESTAMP,
+                load_batch_id BIGINT,
+                PRIMARY KEY (color, year, month));
+
+            -- Creating list of files that failed to load
+            CREATE TABLE IF NOT EXISTS load_quarantine (
+                color VARCHAR,
+                year INTEGER,
+                month INTEGER,
+                path VARCHAR,
+                error VARCHAR,
+                quarantined_at TIMESTAMP,
+                PRIMARY KEY (color, year, month));
         """)
-        print("Created empty tables: yellow_taxi_data and green_taxi_data")
-        logger.info("Created empty tables: yellow_taxi_data and green_taxi_data")
-
-        # Loop through years and months to load taxi data
-        for year in years:
-            for month in months:
-
-                # Construct file paths dynamically based on year and month
-                file_path_yellow = f'https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{year}-{month}.parquet'
-                file_path_green = f'https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_{year}-{month}.parquet'
-
-                # Append yellow taxi data to table
-                con.execute(f"""
-                    -- Insert data into yellow taxi table from parquet
-                    INSERT INTO yellow_taxi_data
-                    SELECT
-                        tpep_pickup_datetime AS pickup_time,
-                        tpep_dropoff_datetime AS dropoff_time,
-                        passenger_count,
-                        trip_distance   
-                    FROM parquet_scan(?);
-                """, [file_path_yellow])
-
-                # Append green taxi data to table
-                con.execute(f"""
-                    -- Insert data into green taxi table from parquet
-                    INSERT INTO green_taxi_data
-                    SELECT
-                        lpep_pickup_datetime AS pickup_time,
-                        lpep_dropoff_datetime AS dropoff_time,
-                        passenger_count,
-                        trip_distance
-                    FROM parquet_scan(?);
-                """, [file_path_green])
-
-                print(f"Appended yellow and green taxi data for {month}/{year} to respective tables")
-                logger.info(f"Appended yellow and green taxi data for {month}/{year} to respective tables")
-                
-                # Sleep for 30 seconds to avoid 403 errors from server
-                time.sleep(30)
+        print("Created tables if missing: yellow_taxi_data, green_taxi_data, load_manifest and load_quarantine")
+        logger.info("Created tables if missing: yellow_taxi_data, green_taxi_data, load_manifest and load_quarantine")
+
+        # Bring tables from before row fingerprints and load batches up to date (older rows count as batch 0)
+        for table in ["yellow_taxi_data", "green_taxi_data"]:
+            con.execute(f"""
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_fingerprint UBIGINT;
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS load_batch_id BIGINT DEFAULT 0;
+                UPDATE {table} SET row_fingerprint = {fingerprint()} WHERE row_fingerprint IS NULL;
+            """)
+        con.execute("ALTER TABLE load_manifest ADD COLUMN IF NOT EXISTS load_batch_id BIGINT DEFAULT 0;")
+
+        # Every row inserted by this run is tagged with the next load batch id
+        load_batch_id = con.execute("SELECT COALESCE(MAX(load_batch_id), 0) + 1 FROM load_manifest").fetchone()[0]
+        print(f"Loading as batch {load_batch_id}")
+        logger.info(f"Loading as batch {load_batch_id}")
+
+        # Download (or reuse mirrored copies of) every monthly file with a rate-limited worker pool
+        files, failures = fetch(list(colors), years, months, base_url = base_url, mirror_dir = mirror_dir,
+                                workers = workers, rate = rate, refresh = refresh)
+        print(f"Fetched {len(files)} parquet files into the local mirror")
+        logger.info(f"Fetched {len(files)} parquet files into the local mirror")
+
+        # Files that could not be fetched are quarantined and the rest are loaded (a re-run retries them)
+        for f in failures:
+            quarantine(con, f, f['error'])
+
+        # Checksums of months already loaded by a previous run
+        loaded = {
+            (color, year, month): sha256
+            for color, year, month, sha256 in con.execute("SELECT color, year, month, sha256 FROM load_manifest").fetchall()
+        }
+
+        # Only months that are new or whose source file changed need loading
+        pending = [f for f in files if loaded.get((f['color'], int(f['year']), int(f['month']))) != f['sha256']]
+
+        for color in colors:
+
+            # Check each file's schema up front and log how its columns map onto the table
+            ready = []
+            for f in [f for f in pending if f['color'] == color]:
+                try:
+                    mapping = column_mapping(con, color, f['path'])
+                except Exception as e:
+                    quarantine(con, f, e)
+                    continue
+                logger.info(f"Column mapping for {color} {f['month']}/{f['year']}: " +
+                            ", ".join(f"{src} ({src_type}) -> {target}" for target, (src, src_type) in mapping.items()))
+                ready.append(f)
+
+            # Bulk mode loads all of a color's files in one scan; otherwise one file at a time
+            batches = [ready] if bulk else [[f] for f in ready]
+            color_done = []
+            for batch in [b for b in batches if b]:
+                try:
+                    ingest(con, color, batch, load_batch_id, fused)
+                    done = batch
+                except Exception as e:
+                    if len(batch) == 1:
+                        quarantine(con, batch[0], e)
+                        continue
+
+                    # The bulk scan failed, so retry files one at a time to isolate the bad ones
+                    print(f"Bulk ingest of {color} taxi data failed ({e}); retrying file by file")
+                    logger.warning(f"Bulk ingest of {color} taxi data failed ({e}); retrying file by file")
+                    done = []
+                    for f in batch:
+                        try:
+                            ingest(con, color, [f], load_batch_id, fused)
+                            done.append(f)
+                        except Exception as e:
+                            quarantine(con, f, e)
+
+                for f in done:
+                    action = "Reloaded changed" if (color, int(f['year']), int(f['month'])) in loaded else "Appended"
+                    print(f"{action} {color} taxi data for {f['month']}/{f['year']} ({f['row_count']} rows)")
+                    logger.info(f"{action} {color} taxi data for {f['month']}/{f['year']} ({f['row_count']} rows)")
+                    if f['rejected']:
+                        logger.info(f"\tRejected by cleaning rules: " + ", ".join(f"{rule}: {n}" for rule, n in f['rejected'].items()))
+                color_done.extend(done)
+
+            # Per-rule rejection totals for the color (a row may break more than one rule)
+            if fused and color_done:
+                print(f"Rows rejected while loading {color} taxi data:")
+                logger.info(f"Rows rejected while loading {color} taxi data:")
+                for rule, _ in CLEAN_RULES:
+                    total = sum(f['rejected'].get(rule, 0) for f in color_done)
+                    print(f"\t{rule}: {total}")
+                    logger.info(f"\t{rule}: {total}")
         
         print("Taxi data loading completed successfully")
         logger.info("Taxi data loading completed successfully")
 
         # Create vehicle_emissions table from CSV file
         con.execute(f"""
-            -- Create vehicle_emissions table
-            CREATE TABLE vehicle_emissions AS
+            -- Create (or replace) vehicle_emissions table
+            CREATE OR REPLACE TABLE vehicle_emissions AS
             SELECT * FROM read_csv('data/vehicle_emissions.csv');       
         """)
         print("Created vehicle_emissions table from csv file")
@@ -118,13 +344,13 @@ def load():
         # Summary Statistics
 
         # Print/log number of rows in each table
-        for table in ["yellow_taxi_data", "green_taxi_data", "vehicle_emissions"]:
+        for table in [f"{color}_taxi_data" for color in colors] + ["vehicle_emissions"]:
             num_rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
             print(f"{num_rows} rows in {table}")
             logger.info(f"{num_rows} rows in {table}")
 
         # Print/log averages for columns in taxi tables
-        for table in ["yellow_taxi_data", "green_taxi_data"]:
+        for table in [f"{color}_taxi_data" for color in colors]:
             avg = con.execute(f"""
                 -- Get averages for important columns
                 SELECT
@@ -174,6 +400,9 @@ def load():
         logger.info(f"\tCO2 grams per mile: {round(avg_emissions[2], 3)}")
         logger.info(f"\tVehicle Year Average: {round(avg_emissions[3], 1)}")
 
+        print(telemetry(con))
+        logger.info(telemetry(con))
+
         print("load.py script is complete")
         logger.info("load.py script is complete")
 
@@ -181,7 +410,14 @@ def load():
     except Exception as e:
         print(f"An error occurred: {e}")
         logger.error(f"An error occurred: {e}")
+        if shared:
+            raise
 
-# Run load function if script is executed directly
+# Run load function if script is executed directly ('python load.py --refresh' for the monthly refresh)
 if __name__ == "__main__":
-    load()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refresh', action = 'store_true',
+                        help = 're-check mirrored months against the source and reload the ones that changed')
+    args = parser.parse_args()
+    load(refresh = args.refresh)
+
@@ -0,0 +1,150 @@
+# Imports
+import argparse      # For command-line options
+import logging       # For logging messages and errors
+import multiprocessing  # For starting clean worker processes
+import os            # For filesystem operations and worker environments
+import subprocess    # For running dbt
+import time          # For stage timing
+from concurrent.futures import ProcessPoolExecutor  # For one worker process per color
+
+# One log for the whole run: configured before the stage modules are imported, so their loggers write here too
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'parallel.log'                            # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+import analysis      # Analysis on the combined database
+import clean         # Per-color clean
+import load          # Per-color load
+from resources import connect, environment, settings, share  # Connections with the project's resource settings
+
+# Taxi colors, each built in its own database
+COLORS = ['yellow', 'green']
+
+# dbt models that read both colors, built in the combined database once every color is done
+COMBINED_MODELS = ['co2_cube', 'fleet_scenarios', 'trip_sketches', 'trip_histograms']
+
+
+# Database the colors are combined into for the cross-color models and analysis (dbt target 'combined'),
+# kept apart from emissions.duckdb so the single-database pipeline is unaffected
+COMBINED_DATABASE = 'emissions_combined.duckdb'
+
+
+# Database file a color is built in (its dbt target has the same path)
+def color_database(color):
+    return f'emissions_{color}.duckdb'
+
+
+# Load, clean and transform one color in its own database; runs in a worker process with its share of the machine
+def build_color(color, env):
+    os.environ.update(env)
+    timings = {}
+    try:
+        con = connect(color_database(color))
+        try:
+            for stage, run in [('load', lambda: load.load(con = con, colors = [color])),
+                               ('clean', lambda: clean.clean(con = con, colors = [color]))]:
+                start = time.perf_counter()
+                run()
+                timings[stage] = time.perf_counter() - start
+        finally:
+            con.close()
+
+        # dbt takes the database's write lock itself, so the connection is closed first; each color keeps its
+        # artifacts (manifest, partial parse, run results) and logs apart, since both workers run dbt at once
+        start = time.perf_counter()
+        subprocess.run(['dbt', 'run', '--target', color, '--select', f'final_{color}_data',
+                        '--target-path', os.path.join('target', color), '--log-path', os.path.join('logs', color)],
+                       cwd = 'dbt', check = True, env = dict(os.environ), stdout = subprocess.DEVNULL)
+        timings['transform'] = time.perf_counter() - start
+        return {'color': color, 'status': 'succeeded', 'timings': timings, 'error': None}
+    except Exception as e:
+        logger.error(f"Building {color} failed: {e}")
+        return {'color': color, 'status': 'failed', 'timings': timings, 'error': str(e)}
+
+
+# Copy the rebuilt colors' final tables (and the emissions lookup) into the combined database, plus any color the
+# combined database has no table for yet; the other colors' copies are current already. Readers of the combined
+# database, and snapshots published from it, never hold the color databases open, so a color can be rebuilt meanwhile
+def combine(colors = COLORS, database = COMBINED_DATABASE):
+    con = connect(database)
+    try:
+        existing = {row[0] for row in con.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main';"
+        ).fetchall()}
+        copied = [color for color in COLORS if color in colors or f'final_{color}_data' not in existing]
+        missing = [color for color in copied if not os.path.exists(color_database(color))]
+        if missing:
+            raise RuntimeError(f"No database built for {', '.join(missing)}; run 'python parallel.py {' '.join(missing)}'")
+
+        for color in copied:
+            con.execute(f"ATTACH '{os.path.abspath(color_database(color))}' AS emissions_{color} (READ_ONLY);")
+        con.execute("BEGIN TRANSACTION;")
+        for color in copied:
+            con.execute(f"CREATE OR REPLACE TABLE final_{color}_data AS SELECT * FROM emissions_{color}.main.final_{color}_data;")
+        con.execute(f"CREATE OR REPLACE TABLE vehicle_emissions AS SELECT * FROM emissions_{copied[0]}.main.vehicle_emissions;")
+        con.execute("COMMIT;")
+        for color in copied:
+            con.execute(f"DETACH emissions_{color};")
+    finally:
+        con.close()
+    print(f"Combined {', '.join(color_database(color) for color in copied)} into {database}")
+    logger.info(f"Combined {', '.join(color_database(color) for color in copied)} into {database}")
+
+
+# Build the given colors in parallel worker processes, then copy them into the combined database and run the
+# cross-color models and analysis there; a failed color can be rebuilt on its own later
+def run(colors = COLORS, analyze = True):
+    resolved = settings()
+    env = environment(share(resolved, len(colors)))
+    env['DUCKDB_PARTITIONS'] = str(max(1, resolved['partitions'] // len(colors)))
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context('spawn')  # Fresh interpreters, so no DuckDB state is inherited
+    with ProcessPoolExecutor(max_workers = len(colors), mp_context = context) as pool:
+        results = list(pool.map(build_color, colors, [env] * len(colors)))
+    wall = time.perf_counter() - start
+
+    for result in results:
+        timings = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in result['timings'].items())
+        print(f"{result['color']}: {result['status']} ({timings}){': ' + result['error'] if result['error'] else ''}")
+        logger.info(f"{result['color']}: {result['status']} ({timings}){': ' + result['error'] if result['error'] else ''}")
+    print(f"Built {', '.join(colors)} in {wall:.2f}s")
+    logger.info(f"Built {', '.join(colors)} in {wall:.2f}s")
+
+    failed = [result['color'] for result in results if result['status'] != 'succeeded']
+    if failed:
+        raise RuntimeError(f"Failed to build {', '.join(failed)}; retry with 'python parallel.py {' '.join(failed)}'")
+
+    combine(colors)
+    subprocess.run(['dbt', 'run', '--target', 'combined', '--select'] + COMBINED_MODELS, cwd = 'dbt', check = True,
+                   env = dict(os.environ, **environment(resolved)), stdout = subprocess.DEVNULL)
+    print(f"Built {', '.join(COMBINED_MODELS)} on the combined database")
+    logger.info(f"Built {', '.join(COMBINED_MODELS)} on the combined database")
+
+    if analyze:
+        con = connect(COMBINED_DATABASE)
+        try:
+            analysis.analyze(con = con)
+        finally:
+            con.close()
+    return results
+
+
+# Run the parallel pipeline if script is executed directly ('python parallel.py green' rebuilds only green)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('colors', nargs = '*', help = f"colors to build, from {', '.join(COLORS)} (default: all)")
+    parser.add_argument('--no-analyze', action = 'store_true', help = 'skip analysis.py on the combined database')
+    args = parser.parse_args()
+    unknown = set(args.colors) - set(COLORS)
+    if unknown:
+        parser.error(f"unknown colors: {', '.join(sorted(unknown))}")
+    try:
+        run(args.colors or COLORS, not args.no_analyze)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
+        raise SystemExit(1)
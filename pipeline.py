@@ -0,0 +1,372 @@
+# Imports
+import argparse      # For command-line options
+import datetime      # For run timestamps
+import duckdb        # For DuckDB errors
+import json          # For profiler output and the run report
+import logging       # For logging messages and errors
+import os            # For filesystem operations
+import resource      # For the peak RSS of child processes (dbt)
+import subprocess    # For running dbt
+import threading     # For the RSS sampler and statement log lock
+import time          # For stage timing
+import uuid          # For run identifiers
+
+from resources import connect, environment, settings  # Connections with the project's resource settings
+
+# One log for the whole run: configured before the stage modules are imported, so their loggers write here too
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'pipeline.log'                            # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+import analysis      # Analyze stage
+import clean         # Clean stage
+import load          # Load stage
+
+# Where the per-run JSON reports and per-connection profiler output go
+REPORT_DIR = 'reports'
+
+# Statements slower than this many seconds have their DuckDB profile kept
+HEAVY_SECONDS = 0.5
+
+
+# Connection wrapper that times every statement and keeps the DuckDB profile (the EXPLAIN ANALYZE JSON)
+# of the heavy ones; cursors are wrapped too so clean.py's parallel partitions are profiled.
+# DuckDB writes a SELECT's profile only once its whole result has been fetched (and never for BEGIN, COMMIT or DROP),
+# so a heavy statement's profile is read just before the connection's next statement, when it is closed,
+# or at the end of the stage, after fetching whatever the caller left of its result (the next statement would
+# discard it anyway); a profile that is missing or belongs to another statement is recorded as None
+class ProfiledConnection:
+
+    def __init__(self, con, pipeline):
+        self.con = con
+        self.pipeline = pipeline
+        self.profile_path = pipeline.profile_path()
+        self.pending = None     # (stage, query, seconds) of a heavy statement whose profile has not been read yet
+        con.execute("PRAGMA enable_profiling = 'json';")
+        con.execute(f"PRAGMA profiling_output = '{self.profile_path}';")
+        pipeline.register(self)
+
+    def execute(self, query, parameters = None):
+        self.flush()
+        if os.path.exists(self.profile_path):
+            os.remove(self.profile_path)  # So a statement that writes no profile is not given the previous one's
+        start = time.perf_counter()
+        result = self.con.execute(query) if parameters is None else self.con.execute(query, parameters)
+        elapsed = time.perf_counter() - start
+        if elapsed >= self.pipeline.heavy_seconds:
+            self.pending = (self.pipeline.stage, query, elapsed)
+        return result
+
+    # Record the pending heavy statement with its profile; profiling problems never fail the stage
+    def flush(self):
+        if self.pending is None:
+            return
+        stage, query, elapsed = self.pending
+        self.pending = None
+        try:
+            try:
+                self.con.fetchall()
+            except duckdb.Error:
+                pass  # No result left to fetch (DDL, or a result already handed to an Arrow reader)
+            with open(self.profile_path) as f:
+                profile = json.load(f)
+            if ' '.join(profile.get('query_name', '').split()) not in ' '.join(query.split()):
+                profile = None
+        except Exception as e:
+            logger.warning(f"No profile for a heavy statement: {e}")
+            profile = None
+        self.pipeline.record_statement(stage, query, elapsed, profile)
+
+    def cursor(self):
+        return ProfiledConnection(self.con.cursor(), self.pipeline)
+
+    def close(self):
+        self.flush()
+        self.pipeline.unregister(self)
+        self.con.close()
+
+    # Everything else (executemany, fetch*, ...) goes straight to DuckDB
+    def __getattr__(self, name):
+        return getattr(self.con, name)
+
+
+# Background thread recording the highest resident set size seen while a stage runs and, given a connection,
+# DuckDB's own peak memory and spill to temporary files (its profiler only keeps a high-water mark since connecting)
+class ResourceSampler:
+
+    def __init__(self, con = None, interval = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self.cursor = con.cursor() if con is not None else None
+        self.duckdb_memory = None
+        self.duckdb_spill = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    # Current RSS in bytes (from /proc on Linux, otherwise the process high-water mark)
+    @staticmethod
+    def rss():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def sample(self):
+        self.peak = max(self.peak, self.rss())
+        if self.cursor is not None:
+            memory, spill = self.cursor.execute("""
+                SELECT SUM(memory_usage_bytes), SUM(temporary_storage_bytes) FROM duckdb_memory();
+            """).fetchone()
+            self.duckdb_memory = max(self.duckdb_memory or 0, memory)
+            self.duckdb_spill = max(self.duckdb_spill or 0, spill)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        if self.cursor is not None:
+            self.cursor.close()
+
+
+# Runs the stages in dependency order on one shared connection and profiles each of them
+class Pipeline:
+
+    # Stage name -> (stages it depends on, tables whose rows it produces)
+    STAGES = {
+        'load': ([], ['yellow_taxi_data', 'green_taxi_data']),
+        'clean': (['load'], ['yellow_taxi_data', 'green_taxi_data']),
+        'transform': (['clean'], ['final_yellow_data', 'final_green_data']),
+        'analyze': (['transform'], ['final_yellow_data', 'final_green_data']),
+    }
+
+    def __init__(self, database = 'emissions.duckdb', report_dir = REPORT_DIR, heavy_seconds = HEAVY_SECONDS,
+                 options = None, profile = None):
+        self.database = database
+        self.resolved = settings(profile)   # Resource settings for every connection, including dbt's
+        self.report_dir = report_dir
+        self.heavy_seconds = heavy_seconds
+        self.options = options or {}    # Stage name -> keyword arguments for that stage
+        self.run_id = str(uuid.uuid4())
+        self.con = None
+        self.stage = None
+        self.statements = []
+        self.profiles = 0
+        self.profiled = set()   # Open profiled connections and cursors, flushed at the end of each stage
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(report_dir, 'profiles'), exist_ok = True)
+
+    # Fresh profiler output file for each wrapped connection or cursor
+    def profile_path(self):
+        with self.lock:
+            self.profiles += 1
+            return os.path.abspath(os.path.join(self.report_dir, 'profiles', f'{self.run_id}-{self.profiles}.json'))
+
+    def register(self, con):
+        with self.lock:
+            self.profiled.add(con)
+
+    def unregister(self, con):
+        with self.lock:
+            self.profiled.discard(con)
+
+    # Read the profiles of heavy statements still waiting on their results
+    def flush_profiles(self):
+        with self.lock:
+            profiled = list(self.profiled)
+        for con in profiled:
+            con.flush()
+
+    def record_statement(self, stage, query, seconds, profile):
+        with self.lock:
+            self.statements.append({
+                'stage': stage,
+                'statement': ' '.join(query.split())[:200],
+                'seconds': seconds,
+                'rows': profile.get('rows_returned') if profile else None,
+                'profile': profile,
+            })
+
+    def connect(self):
+        self.con = ProfiledConnection(connect(self.database, resolved = self.resolved), self)
+
+    def close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+    # Stages
+    def run_load(self):
+        load.load(con = self.con, **self.options.get('load', {}))
+
+    def run_clean(self):
+        clean.clean(con = self.con, **dict({'resolved': self.resolved}, **self.options.get('clean', {})))
+
+    # dbt opens the database itself, so the shared connection is released while it runs
+    def run_transform(self):
+        self.close()
+        try:
+            args = ['dbt', 'run'] + self.options.get('transform', {}).get('args', [])
+            subprocess.run(args, cwd = 'dbt', check = True, env = dict(os.environ, **environment(self.resolved)))
+        finally:
+            self.connect()
+
+    def run_analyze(self):
+        analysis.analyze(con = self.con, **self.options.get('analyze', {}))
+
+    # Rows in a stage's output tables, for rows/sec
+    def count_rows(self, tables):
+        existing = {row[0] for row in self.con.con.execute("SELECT table_name FROM information_schema.tables;").fetchall()}
+        return sum(self.con.con.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0] for table in tables if table in existing)
+
+    # Record every stage's results in pipeline_runs
+    def save_results(self, results):
+        self.con.con.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_runs (
+                run_id VARCHAR,
+                stage VARCHAR,
+                status VARCHAR,
+                started_at TIMESTAMP,
+                wall_seconds DOUBLE,
+                rows BIGINT,
+                rows_per_second DOUBLE,
+                peak_rss_mb DOUBLE,
+                heavy_statements INTEGER,
+                slowest_statement VARCHAR,
+                slowest_seconds DOUBLE,
+                error VARCHAR);
+
+            -- Columns added with the resource governor
+            ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS resource_profile VARCHAR;
+            ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS peak_buffer_mb DOUBLE;
+            ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS peak_spill_mb DOUBLE;
+        """)
+        self.con.con.executemany(
+            """INSERT INTO pipeline_runs BY NAME
+               SELECT ? AS run_id, ? AS stage, ? AS status, ? AS started_at, ? AS wall_seconds, ? AS rows,
+                      ? AS rows_per_second, ? AS peak_rss_mb, ? AS heavy_statements, ? AS slowest_statement,
+                      ? AS slowest_seconds, ? AS error, ? AS resource_profile, ? AS peak_buffer_mb, ? AS peak_spill_mb""",
+            [[self.run_id, r['stage'], r['status'], r['started_at'], r['wall_seconds'], r['rows'], r['rows_per_second'],
+              r['peak_rss_mb'], r['heavy_statements'], r['slowest_statement'], r['slowest_seconds'], r['error'],
+              self.resolved['profile'], r['peak_buffer_mb'], r['peak_spill_mb']]
+             for r in results]
+        )
+
+    # Run the selected stages in dependency order; a stage whose dependency failed is skipped
+    def run(self, stages = None):
+        selected = [stage for stage in self.STAGES if stages is None or stage in stages]
+        results = []
+        failed = set()
+        self.connect()
+
+        for stage in selected:
+            depends_on, tables = self.STAGES[stage]
+            started_at = datetime.datetime.now()
+            result = {'stage': stage, 'started_at': started_at, 'wall_seconds': None, 'rows': None,
+                      'rows_per_second': None, 'peak_rss_mb': None, 'heavy_statements': 0,
+                      'slowest_statement': None, 'slowest_seconds': None, 'error': None,
+                      'peak_buffer_mb': None, 'peak_spill_mb': None}
+
+            if failed.intersection(depends_on):
+                result['status'] = 'skipped'
+                failed.add(stage)
+                results.append(result)
+                print(f"Skipped {stage}: a stage it depends on failed")
+                logger.info(f"Skipped {stage}: a stage it depends on failed")
+                continue
+
+            print(f"Running {stage}")
+            logger.info(f"Running {stage}")
+            self.stage = stage
+            start = time.perf_counter()
+            # (dbt replaces the shared connection, so its DuckDB memory is not sampled)
+            with ResourceSampler(self.con.con if stage != 'transform' else None) as sampler:
+                try:
+                    getattr(self, f'run_{stage}')()
+                    result['status'] = 'succeeded'
+                except Exception as e:
+                    result['status'] = 'failed'
+                    result['error'] = str(e)
+                    failed.add(stage)
+            wall = time.perf_counter() - start
+            self.flush_profiles()
+
+            # dbt runs as a child process, so its memory shows up in the children's high-water mark
+            peak = sampler.peak
+            if stage == 'transform':
+                peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+            heavy = [s for s in self.statements if s['stage'] == stage]
+            slowest = max(heavy, key = lambda s: s['seconds'], default = None)
+            rows = self.count_rows(tables) if result['status'] == 'succeeded' else None
+            memory, spill = sampler.duckdb_memory, sampler.duckdb_spill
+            result.update(
+                wall_seconds = wall,
+                rows = rows,
+                rows_per_second = rows / wall if rows is not None and wall > 0 else None,
+                peak_rss_mb = peak / 1e6,
+                peak_buffer_mb = memory / 1e6 if memory is not None else None,
+                peak_spill_mb = spill / 1e6 if spill is not None else None,
+                heavy_statements = len(heavy),
+                slowest_statement = slowest['statement'] if slowest else None,
+                slowest_seconds = slowest['seconds'] if slowest else None,
+            )
+            results.append(result)
+            duckdb_peaks = f", DuckDB peak {memory / 1e6:.0f} MB buffers, {spill / 1e6:.0f} MB spilled" if memory is not None else ""
+            print(f"{stage}: {result['status']} in {wall:.2f}s, {rows} rows, peak RSS {peak / 1e6:.0f} MB{duckdb_peaks}, {len(heavy)} heavy statements")
+            logger.info(f"{stage}: {result['status']} in {wall:.2f}s, {rows} rows, peak RSS {peak / 1e6:.0f} MB{duckdb_peaks}, {len(heavy)} heavy statements")
+
+        self.stage = None
+        self.save_results(results)
+        self.close()
+
+        # Full report, including the profile of every heavy statement
+        report_path = os.path.join(self.report_dir, f'pipeline-{self.run_id}.json')
+        with open(report_path, 'w') as f:
+            json.dump({'run_id': self.run_id, 'resources': self.resolved, 'stages': results, 'statements': self.statements},
+                      f, indent = 2, default = str)
+        print(f"Saved pipeline report to {report_path}")
+        logger.info(f"Saved pipeline report to {report_path}")
+
+        # Per-connection profiler files only hold the last statement; everything worth keeping is in the report
+        for name in os.listdir(os.path.join(self.report_dir, 'profiles')):
+            if name.startswith(self.run_id):
+                os.remove(os.path.join(self.report_dir, 'profiles', name))
+
+        return results
+
+
+# Run the pipeline if script is executed directly ('python pipeline.py clean transform' runs only those stages)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stages', nargs = '*', help = f"stages to run, from {', '.join(Pipeline.STAGES)} (default: all)")
+    parser.add_argument('--heavy-seconds', type = float, default = HEAVY_SECONDS,
+                        help = 'keep the DuckDB profile of statements slower than this')
+    parser.add_argument('--profile', help = 'resource profile (default: DUCKDB_PROFILE, resources.json or default)')
+    parser.add_argument('--refresh', action = 'store_true',
+                        help = 're-check mirrored months against the source and reload the ones that changed')
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(Pipeline.STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    try:
+        results = Pipeline(heavy_seconds = args.heavy_seconds, profile = args.profile,
+                           options = {'load': {'refresh': args.refresh}}).run(args.stages or None)
+        if any(r['status'] != 'succeeded' for r in results):
+            raise SystemExit(1)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
+        raise SystemExit(1)
@@ -0,0 +1,78 @@
+# Imports
+import time          # For timing verification scans
+
+# Cleaning rules shared by clean.py and load.py's fused load+clean mode.
+# Each rule is (name, SQL predicate a row must satisfy to be kept).
+CLEAN_RULES = [
+    ('zero_passengers', "passenger_count > 0"),                                  # Remove trips with 0 passengers
+    ('zero_miles', "trip_distance > 0"),                                         # Remove trips of 0 miles
+    ('over_100_miles', "trip_distance <= 100"),                                  # Remove trips longer than 100 miles
+    ('over_one_day', "date_diff('seconds', pickup_time, dropoff_time) <= 86400"),  # Remove trips longer than 1 day
+]
+
+# Columns that identify a trip when checking for duplicates
+TRIP_COLUMNS = ['pickup_time', 'dropoff_time', 'passenger_count', 'trip_distance']
+
+
+# SQL expression for a row's 64-bit fingerprint of its trip columns
+def fingerprint():
+    return f"hash({', '.join(TRIP_COLUMNS)})"
+
+
+# SQL predicate that keeps only rows passing every cleaning rule
+def keep_predicate():
+    return ' AND '.join(f'({predicate})' for _, predicate in CLEAN_RULES)
+
+
+# SQL columns flagging whether a row passes each rule (a NULL result counts as failing, as in a WHERE clause)
+def rule_flags():
+    return ',\n'.join(f'coalesce({predicate}, false) AS passes_{name}' for name, predicate in CLEAN_RULES)
+
+
+# SQL aggregates over rule_flags() columns counting the rows each rule rejects
+def rejection_counts():
+    return ',\n'.join(f'count_if(NOT passes_{name}) AS {name}' for name, _ in CLEAN_RULES)
+
+
+# Post-cleaning checks: (rule name, confirmation label, SQL predicate matching a violating row).
+# Duplicates are handled separately since they are not a per-row condition.
+VERIFY_RULES = [
+    ('zero_passengers', 'Number of trips with 0 passengers', "passenger_count == 0"),
+    ('zero_miles', 'Number of trips of 0 miles in length', "trip_distance == 0"),
+    ('over_100_miles', 'Number of trips > 100 miles in length', "trip_distance > 100"),
+    ('over_one_day', 'Number of trips lasting over a day', "date_diff('seconds', pickup_time, dropoff_time) > 86400"),
+]
+
+
+# Check every rule against a table in one aggregate scan, record the results in dq_results,
+# and return a list of (rule name, confirmation label, violating count)
+def verify(con, table, run_id):
+    start = time.perf_counter()
+
+    # Duplicates are counted by comparing row hashes instead of running a second DISTINCT over the table
+    counts = con.execute(f"""
+        SELECT
+            COUNT(*) - COUNT(DISTINCT {fingerprint()}) AS duplicates,
+            {', '.join(f'count_if({predicate}) AS {name}' for name, _, predicate in VERIFY_RULES)}
+        FROM {table};
+    """).fetchone()
+    elapsed = time.perf_counter() - start
+
+    results = [('duplicates', 'Number of duplicate rows', counts[0])]
+    results += [(name, label, count) for (name, label, _), count in zip(VERIFY_RULES, counts[1:])]
+
+    # Keep a history of the results so quality can be tracked without re-scanning
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS dq_results (
+            run_id VARCHAR,
+            table_name VARCHAR,
+            rule VARCHAR,
+            violating_count BIGINT,
+            elapsed_seconds DOUBLE,
+            checked_at TIMESTAMP);
+    """)
+    con.executemany(
+        "INSERT INTO dq_results VALUES (?, ?, ?, ?, ?, current_timestamp)",
+        [[run_id, table, name, count, elapsed] for name, _, count in results]
+    )
+    return results
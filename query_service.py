@@ -0,0 +1,300 @@
+# Imports
+import json          # For the snapshot pointer and HTTP responses
+import logging       # For logging messages and errors
+import os            # For filesystem operations
+import queue         # For the read-only connection pool
+import shutil        # For copying the database into a snapshot
+import sys           # For command-line arguments
+import threading     # For the cache and pool locks
+import time          # For snapshot version numbers
+import urllib.parse  # For parsing query strings
+from collections import OrderedDict                                # For the LRU result cache
+from contextlib import contextmanager                              # For borrowing pooled connections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # For the local HTTP endpoint
+
+import duckdb        # For checking statement types
+import analysis      # For the report queries
+from export import EXPORT_DIR  # Parquet files the _compact views read
+from resources import connect, settings  # Connections with the project's resource settings
+
+# Initializing logger
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'query_service.log'                       # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+# Database written by the pipeline, and where its read-only snapshots are published
+DATABASE = 'emissions.duckdb'
+SNAPSHOT_DIR = 'snapshots'
+
+# Number of published snapshots kept on disk (readers may still be using the previous one)
+KEEP_SNAPSHOTS = 2
+
+
+# Path of the file naming the current snapshot
+def pointer_path(snapshot_dir):
+    return os.path.join(snapshot_dir, 'CURRENT')
+
+
+# Return (version, path) of the current snapshot, or None if nothing has been published yet
+def current_snapshot(snapshot_dir = SNAPSHOT_DIR):
+    try:
+        with open(pointer_path(snapshot_dir)) as f:
+            pointer = json.load(f)
+    except FileNotFoundError:
+        return None
+    return pointer['version'], os.path.join(snapshot_dir, pointer['file'])
+
+
+# Publish a copy of the database as the new current snapshot. Run by the writer after each pipeline run:
+# the copy is taken after a checkpoint with no connection open, and the pointer is swapped atomically
+def publish(database = DATABASE, snapshot_dir = SNAPSHOT_DIR):
+    os.makedirs(snapshot_dir, exist_ok = True)
+
+    # Fold the write-ahead log into the database file so the copy is complete on its own
+    con = connect(database = database)
+    con.execute("CHECKPOINT;")
+    con.close()
+
+    version = time.time_ns()
+    name = f'emissions-{version}.duckdb'
+    tmp = os.path.join(snapshot_dir, f'{name}.tmp')
+    shutil.copyfile(database, tmp)
+    os.replace(tmp, os.path.join(snapshot_dir, name))
+
+    # Readers pick up the new snapshot the next time they check the pointer
+    pointer_tmp = f'{pointer_path(snapshot_dir)}.tmp'
+    with open(pointer_tmp, 'w') as f:
+        json.dump({'version': version, 'file': name}, f)
+    os.replace(pointer_tmp, pointer_path(snapshot_dir))
+
+    # Drop old snapshots (open handles keep working on POSIX until they are closed)
+    snapshots = sorted(f for f in os.listdir(snapshot_dir) if f.startswith('emissions-') and f.endswith('.duckdb'))
+    for old in snapshots[:-KEEP_SNAPSHOTS]:
+        os.remove(os.path.join(snapshot_dir, old))
+
+    print(f"Published snapshot {version} to {snapshot_dir}")
+    logger.info(f"Published snapshot {version} to {snapshot_dir}")
+    return version
+
+
+# Pool of read-only connections to one snapshot
+class SnapshotPool:
+
+    def __init__(self, version, path, size):
+        self.version = version
+        self.closed = False
+        self.connections = queue.Queue()
+        # DuckDB shares one database instance (and its configuration) between connections to the same file in
+        # a process, so the restricted connection is opened once and the pool hands out cursors on it
+        self.base = self.open(path)
+        for _ in range(size):
+            self.connections.put(self.base.cursor())
+
+    # Read-only connection that can only touch the snapshot, the export's parquet files and the spill directory,
+    # with its configuration locked, so a query cannot read or write other files or turn file access back on
+    @staticmethod
+    def open(path):
+        resolved = settings()
+        con = connect(database = path, read_only = True, resolved = resolved)
+        allowed = [os.path.join(os.path.abspath(EXPORT_DIR), ''), os.path.join(resolved['temp_directory'], '')]
+        con.execute(f"SET allowed_directories = {allowed};")
+        con.execute("SET enable_external_access = false;")
+        con.execute("SET lock_configuration = true;")
+        return con
+
+    # Wait for a free connection; fails instead of blocking forever once the pool is closed
+    def acquire(self):
+        while True:
+            if self.closed:
+                raise RuntimeError(f"Connection pool for snapshot {self.version} is closed")
+            try:
+                return self.connections.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+
+    def release(self, con):
+        self.connections.put(con)
+
+    # Close every connection once no reader is using the pool any more
+    def close(self):
+        self.closed = True
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+        self.base.close()
+
+
+# Query service over the published snapshot: pooled read-only connections plus an LRU result cache
+# keyed on (query, parameters, snapshot version), so results never outlive the snapshot they came from
+class QueryService:
+
+    def __init__(self, snapshot_dir = SNAPSHOT_DIR, pool_size = 4, cache_size = 256):
+        self.snapshot_dir = snapshot_dir
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.pool = None
+        self.borrowed = {}      # Number of connections borrowed from each version's pool
+        self.retired = {}       # Pools replaced by a newer snapshot, closed once returned
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # Switch to the current snapshot if a newer one has been published, and return the pool to use.
+    # The caller is counted as a borrower before the lock is released, so the pool cannot be closed under it
+    def current_pool(self):
+        snapshot = current_snapshot(self.snapshot_dir)
+        if snapshot is None:
+            raise RuntimeError(f"No snapshot published in {self.snapshot_dir}; run 'python query_service.py publish'")
+        version, path = snapshot
+        with self.lock:
+            if self.pool is None or self.pool.version != version:
+                if self.pool is not None:
+                    self.retire(self.pool)
+                self.pool = SnapshotPool(version, path, self.pool_size)
+                logger.info(f"Serving snapshot {version}")
+            self.borrowed[version] = self.borrowed.get(version, 0) + 1
+            return self.pool
+
+    # Stop handing out an old pool, closing it now if no reader holds one of its connections
+    def retire(self, pool):
+        if self.borrowed.get(pool.version, 0):
+            self.retired[pool.version] = pool
+        else:
+            pool.close()
+        # Cached results of older snapshots can never be hit again
+        for key in [key for key in self.cache if key[-1] == pool.version]:
+            del self.cache[key]
+
+    # Borrow a read-only connection to the current snapshot
+    @contextmanager
+    def connection(self):
+        pool = self.current_pool()
+        con = None
+        try:
+            con = pool.acquire()
+            yield pool.version, con
+        finally:
+            if con is not None:
+                pool.release(con)
+            with self.lock:
+                self.borrowed[pool.version] -= 1
+                if not self.borrowed[pool.version] and pool.version in self.retired:
+                    self.retired.pop(pool.version).close()
+
+    # Return a cached result, or compute it on a pooled connection and cache it
+    def cached(self, key, compute):
+        with self.connection() as (version, con):
+            key = key + (version,)
+            with self.lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return self.cache[key]
+                self.misses += 1
+            result = compute(con)
+            with self.lock:
+                self.cache[key] = result
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last = False)
+            return result
+
+    # Run a single SELECT against the current snapshot and return {'columns': [...], 'rows': [...]}
+    def query(self, sql, params = ()):
+        def compute(con):
+            statements = con.extract_statements(sql)
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                raise ValueError("Only a single SELECT statement can be queried")
+            cursor = con.execute(sql, list(params))
+            return {'columns': [column[0] for column in cursor.description], 'rows': cursor.fetchall()}
+        return self.cached(('query', sql, tuple(params)), compute)
+
+    # The analysis report (largest trip and per-period averages for each color), as analysis.py computes it
+    def report(self, compact = False):
+        def compute(con):
+            tables = {color: f"final_{color.lower()}_data{'_compact' if compact else ''}" for color in ['YELLOW', 'GREEN']}
+            has_cube = con.execute(
+                "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'co2_cube';"
+            ).fetchone()[0] > 0
+            return analysis.co2_groupings_from_cube(con, tables) if has_cube else analysis.co2_groupings(con, tables)
+        return self.cached(('report', compact), compute)
+
+    def stats(self):
+        with self.lock:
+            return {'version': self.pool.version if self.pool else None, 'cached': len(self.cache),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# HTTP endpoint: POST /query with a JSON body {"sql": "SELECT ...", "params": [...]}, GET /report[?compact=1], GET /stats
+# (ad-hoc SQL is only taken as a JSON POST, which a web page cannot send cross-site without a CORS preflight)
+def make_handler(service):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            if urllib.parse.urlparse(self.path).path != '/query':
+                self.send_error(404)
+                return
+            if self.headers.get('Content-Type', '').split(';')[0].strip() != 'application/json':
+                self.send_error(415)
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                self.respond(200, service.query(request['sql'], request.get('params', [])))
+            except Exception as e:
+                logger.error(f"Query failed: {e}")
+                self.respond(400, {'error': str(e)})
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            args = urllib.parse.parse_qs(url.query)
+            try:
+                if url.path == '/report':
+                    result = service.report(args.get('compact', ['0'])[0] == '1')
+                elif url.path == '/stats':
+                    result = service.stats()
+                else:
+                    self.send_error(404)
+                    return
+                self.respond(200, result)
+            except Exception as e:
+                logger.error(f"Query failed: {e}")
+                self.respond(400, {'error': str(e)})
+
+        # Send a JSON response
+        def respond(self, status, result):
+            body = json.dumps(result, default = str).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.info(format % args)
+
+    return Handler
+
+
+# Serve the current snapshot over HTTP on localhost
+def serve(port = 8022, snapshot_dir = SNAPSHOT_DIR, pool_size = 4, cache_size = 256):
+    service = QueryService(snapshot_dir, pool_size, cache_size)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(service))
+    print(f"Serving snapshots from {snapshot_dir} on http://127.0.0.1:{port}")
+    logger.info(f"Serving snapshots from {snapshot_dir} on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+# 'python query_service.py publish [database]' publishes a snapshot (e.g. of parallel.py's emissions_combined.duckdb);
+# 'python query_service.py' serves it
+if __name__ == "__main__":
+    try:
+        if sys.argv[1:2] == ['publish']:
+            publish(*sys.argv[2:3])
+        else:
+            serve()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
@@ -0,0 +1,136 @@
+# Imports
+import duckdb        # For interacting with DuckDB databases
+import json          # For reading the resource file
+import os            # For environment variables and machine size
+import shutil        # For free disk space in the spill directory
+
+# Resource profiles for every DuckDB connection the project opens (load, clean, dbt, analysis, export, ...).
+# memory_limit is a share of physical memory ('60%') or a DuckDB size ('4GB'); threads of None uses every core;
+# max_temp_directory_size is a share of the spill directory's free disk space or a size; partitions is how many
+# months clean.py works on at once
+PROFILES = {
+    'default': {
+        'memory_limit': '60%',
+        'threads': None,
+        'temp_directory': 'tmp',
+        'max_temp_directory_size': '90%',
+        'preserve_insertion_order': True,
+        'partitions': 2,
+    },
+    # Small machines: a fixed 1GB budget, two threads, one month cleaned at a time, and no insertion-order buffering,
+    # so every large operator can spill to disk instead of running out of memory
+    'low-memory': {
+        'memory_limit': '1GB',
+        'threads': 2,
+        'temp_directory': 'tmp',
+        'max_temp_directory_size': '90%',
+        'preserve_insertion_order': False,
+        'partitions': 1,
+    },
+}
+
+# Optional JSON file with a "profile" name and/or individual settings, e.g. {"profile": "low-memory", "threads": 4}
+RESOURCES_FILE = os.environ.get('RESOURCES_FILE', 'resources.json')
+
+# Environment variables overriding the profile and file (DUCKDB_PROFILE picks the profile)
+ENV_VARS = {name: f'DUCKDB_{name.upper()}' for name in PROFILES['default']}
+
+# Settings passed to DuckDB itself (partitions is only used by clean.py)
+DUCKDB_SETTINGS = ['memory_limit', 'threads', 'temp_directory', 'max_temp_directory_size', 'preserve_insertion_order']
+
+
+# Physical memory of the machine in bytes
+def physical_memory():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+# Bytes in a DuckDB size such as '4GB', '512MiB' or '1000000'
+def size_bytes(size):
+    units = {'KB': 1e3, 'MB': 1e6, 'GB': 1e9, 'TB': 1e12, 'KIB': 2 ** 10, 'MIB': 2 ** 20, 'GIB': 2 ** 30, 'TIB': 2 ** 40}
+    size = str(size).strip().upper()
+    for unit, factor in sorted(units.items(), key = lambda u: -len(u[0])):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(float(size.rstrip('B')))
+
+
+# Settings for one of several workers sharing the machine: each gets an equal share of memory and threads
+def share(resolved, workers):
+    return dict(resolved,
+                memory_limit = f"{size_bytes(resolved['memory_limit']) // workers // 1_000_000}MB",
+                threads = max(1, resolved['threads'] // workers))
+
+
+# Resolve the settings in effect: the chosen profile, then the resource file, then environment variables
+# (root is the directory the resource file and a relative temp_directory are found in, '..' from dbt/)
+def settings(profile = None, root = '.'):
+    overrides = {}
+    resources_file = os.path.join(root, RESOURCES_FILE)
+    if os.path.exists(resources_file):
+        with open(resources_file) as f:
+            overrides = json.load(f)
+
+    profile = profile or os.environ.get('DUCKDB_PROFILE') or overrides.pop('profile', 'default')
+    overrides.pop('profile', None)
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown resource profile {profile}; choose from {', '.join(PROFILES)}")
+
+    resolved = dict(PROFILES[profile], **overrides)
+    for name, var in ENV_VARS.items():
+        if os.environ.get(var):
+            resolved[name] = os.environ[var]
+
+    # Normalize to what DuckDB accepts
+    memory_limit = str(resolved['memory_limit'])
+    if memory_limit.endswith('%'):
+        memory_limit = f"{int(physical_memory() * float(memory_limit[:-1]) / 100 / 1e6)}MB"
+    resolved['memory_limit'] = memory_limit
+    resolved['threads'] = int(resolved['threads'] or os.cpu_count())
+    resolved['temp_directory'] = os.path.abspath(os.path.join(root, resolved['temp_directory']))
+    max_spill = str(resolved['max_temp_directory_size'])
+    if max_spill.endswith('%'):
+        os.makedirs(resolved['temp_directory'], exist_ok = True)
+        free = shutil.disk_usage(resolved['temp_directory']).free
+        max_spill = f"{int(free * float(max_spill[:-1]) / 100 / 1e6)}MB"
+    resolved['max_temp_directory_size'] = max_spill
+    resolved['preserve_insertion_order'] = str(resolved['preserve_insertion_order']).lower() in ('true', '1')
+    resolved['partitions'] = int(resolved['partitions'])
+    resolved['profile'] = profile
+    return resolved
+
+
+# DuckDB configuration for the resolved settings
+def duckdb_config(resolved):
+    return {name: resolved[name] for name in DUCKDB_SETTINGS}
+
+
+# Open a DuckDB connection with the project's resource settings
+def connect(database = 'emissions.duckdb', read_only = False, resolved = None):
+    resolved = resolved or settings()
+    os.makedirs(resolved['temp_directory'], exist_ok = True)
+    return duckdb.connect(database = database, read_only = read_only, config = duckdb_config(resolved))
+
+
+# Environment variables carrying the resolved settings to dbt (read by dbt/profiles.yml)
+def environment(resolved = None):
+    resolved = resolved or settings()
+    return {ENV_VARS[name]: str(value).lower() if isinstance(value, bool) else str(value)
+            for name, value in duckdb_config(resolved).items()}
+
+
+# One-line summary of a connection's memory use and spill to disk, against its limits
+def telemetry(con):
+    memory, spilled = con.execute("""
+        SELECT SUM(memory_usage_bytes), SUM(temporary_storage_bytes) FROM duckdb_memory();
+    """).fetchone()
+    limit, threads, temp_directory = con.execute("""
+        SELECT current_setting('memory_limit'), current_setting('threads'), current_setting('temp_directory');
+    """).fetchone()
+    return (f"DuckDB memory: {memory / 1e6:.1f} MB in use of {limit}, {spilled / 1e6:.1f} MB in temporary files under {temp_directory}, "
+            f"{threads} threads")
+
+
+# Print the settings as shell exports, e.g. to check what a run will use: eval "$(python resources.py)"
+if __name__ == "__main__":
+    for var, value in environment().items():
+        print(f"export {var}='{value}'")
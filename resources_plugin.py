@@ -0,0 +1,15 @@
+# Imports
+from dbt.adapters.duckdb.plugins import BasePlugin  # dbt-duckdb plugin interface
+from resources import duckdb_config, settings      # The project's resource settings
+
+
+# dbt-duckdb plugin giving dbt's DuckDB connections the same resource settings as every other connection:
+# the profile from DUCKDB_PROFILE or resources.json, the file's overrides and any DUCKDB_* environment variables
+# (dbt/profiles.yml loads it with module_paths: ['..'] and config root: '..', the repository root seen from dbt/)
+class Plugin(BasePlugin):
+
+    def initialize(self, plugin_config):
+        self.root = plugin_config.get('root', '.')
+
+    def update_connection_config(self, creds, config):
+        config.update(duckdb_config(settings(root = self.root)))
@@ -0,0 +1,122 @@
+# Imports
+import logging       # For logging messages and errors
+from resources import connect  # Connections with the project's resource settings
+
+# Initializing logger
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'sketches.log'                            # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+# Metrics with sketches and histograms (built by the trip_sketches and trip_histograms dbt models)
+METRICS = ['trip_co2_kgs', 'trip_distance', 'avg_mph']
+
+# Partition columns results can be grouped by
+PARTITION_COLUMNS = ['color', 'year', 'month', 'hour_of_day']
+
+
+# SQL filter and parameters selecting partitions: color, an inclusive (year, month) range and hours of the day
+def partition_filter(metric, color = None, start = None, end = None, hours = None):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}; choose from {', '.join(METRICS)}")
+    conditions, params = ['metric = ?'], [metric]
+    if color:
+        conditions.append('color = ?')
+        params.append(color.lower())
+    if start:
+        conditions.append('year * 100 + month >= ?')
+        params.append(start[0] * 100 + start[1])
+    if end:
+        conditions.append('year * 100 + month <= ?')
+        params.append(end[0] * 100 + end[1])
+    if hours:
+        conditions.append(f"hour_of_day IN ({', '.join('?' for _ in hours)})")
+        params += list(hours)
+    return ' AND '.join(conditions), params
+
+
+# Merge the selected partitions' sketches by summing their bucket counts: {group: [(bucket, gamma, count), ...]}
+def merged_sketches(con, metric, by, **filters):
+    where, params = partition_filter(metric, **filters)
+    group = [column for column in by if column in PARTITION_COLUMNS]
+    rows = con.execute(f"""
+        SELECT {', '.join(group + ['bucket'])}, ANY_VALUE(gamma), SUM(count) AS count
+        FROM trip_sketches
+        WHERE {where}
+        GROUP BY ALL
+        ORDER BY ALL;
+    """, params).fetchall()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[:len(group)]), []).append(row[len(group):])
+    return groups
+
+
+# Estimated quantiles of a metric for each group of partitions: {group: {q: value}} with group () when by is empty.
+# Each estimate is the midpoint of the bucket holding that rank, within the sketch's relative accuracy
+def quantiles(con, metric, qs = (0.5, 0.95), by = (), **filters):
+    results = {}
+    for group, buckets in merged_sketches(con, metric, by, **filters).items():
+        total = sum(count for _, _, count in buckets)
+        # NULL (non-positive) bucket first, then buckets in increasing value order
+        buckets.sort(key = lambda b: (b[0] is not None, b[0] or 0))
+        estimates = {}
+        for q in qs:
+            rank = q * (total - 1)
+            seen = 0
+            for bucket, gamma, count in buckets:
+                seen += count
+                if seen > rank:
+                    estimates[q] = 0.0 if bucket is None else 2 * gamma ** bucket / (gamma + 1)
+                    break
+        results[group] = estimates
+    return results
+
+
+# Histogram of a metric for each group of partitions: {group: [(bin low, bin high, count), ...]},
+# where a low or high of None is the open end of the under/overflow bin
+def histogram(con, metric, by = (), **filters):
+    where, params = partition_filter(metric, **filters)
+    group = [column for column in by if column in PARTITION_COLUMNS]
+    rows = con.execute(f"""
+        SELECT {', '.join(group + ['bin'])}, ANY_VALUE(bin_low), ANY_VALUE(bin_high), SUM(count) AS count
+        FROM trip_histograms
+        WHERE {where}
+        GROUP BY ALL
+        ORDER BY ALL;
+    """, params).fetchall()
+
+    results = {}
+    for row in rows:
+        *key, _, low, high, count = row
+        results.setdefault(tuple(key), []).append((low, high, count))
+    return results
+
+
+# Print medians and 95th percentiles of every metric by color, and p95 trip CO2 by hour of day
+def summarize(con = None):
+    try:
+        con = con or connect()
+        print("Connected to DuckDB instance")
+        logger.info("Connected to DuckDB instance")
+
+        for metric in METRICS:
+            for (color,), estimates in quantiles(con, metric, (0.5, 0.95), by = ['color']).items():
+                print(f"{color.upper()} {metric}: median {estimates[0.5]:.3f}, p95 {estimates[0.95]:.3f}")
+                logger.info(f"{color.upper()} {metric}: median {estimates[0.5]:.3f}, p95 {estimates[0.95]:.3f}")
+
+        for (color, hour), estimates in quantiles(con, 'trip_co2_kgs', (0.95,), by = ['color', 'hour_of_day']).items():
+            print(f"{color.upper()} p95 trip_co2_kgs at hour {hour}: {estimates[0.95]:.3f}")
+            logger.info(f"{color.upper()} p95 trip_co2_kgs at hour {hour}: {estimates[0.95]:.3f}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
+
+
+# Print the summary if script is executed directly
+if __name__ == "__main__":
+    summarize()
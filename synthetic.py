@@ -0,0 +1,148 @@
+# Imports
+import argparse      # For command-line options
+import calendar      # For the length of each month
+import json          # For the generation manifest
+import logging       # For logging messages and errors
+import os            # For filesystem operations
+
+# Initializing logger (before importing load.py, which would otherwise configure logging to its own file)
+logging.basicConfig(
+    level = logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp, level, and message format
+    filename = 'synthetic.log'                           # Log output file
+)
+logger = logging.getLogger(__name__)  # Create a logger instance
+
+from fetch import source_name   # File names the TLC uses, so the output works as a TLC_BASE_URL
+from load import PREFIXES       # tpep_/lpep_ timestamp column prefixes
+from resources import connect   # Connections with the project's resource settings
+
+# Default rates of each kind of bad row, as fractions of a file's rows
+RATES = {
+    'duplicate_rate': 0.01,        # Exact copies of another row in the same file
+    'zero_passenger_rate': 0.02,   # passenger_count of 0
+    'zero_distance_rate': 0.01,    # trip_distance of 0
+    'long_distance_rate': 0.001,   # trip_distance over 100 miles
+    'long_duration_rate': 0.001,   # Trips lasting over a day
+}
+
+# Green cabs carry far fewer trips than yellow ones
+GREEN_FRACTION = 0.1
+
+# Recorded in the manifest and bumped whenever the same seed starts producing different files,
+# so benchmark.py regenerates sources made by an older generator
+GENERATOR_VERSION = 2
+
+
+# Odd 64-bit constant (2^64 / golden ratio) spreading draw numbers across the whole hash input space
+DRAW_STRIDE = 0x9E3779B97F4A7C15
+
+
+# SQL for a uniform [0, 1) draw that depends only on the row number, the file's seed and which draw it is,
+# so output is identical whatever the thread count or machine. Each draw rehashes the row's hash xor-ed with its
+# own well-spread constant: hash(i, file_seed, draw) alone left draws of the same row correlated (about 0.5)
+def uniform(draw):
+    return f"((hash(xor(hash(i, file_seed), {(draw + 1) * DRAW_STRIDE % 2 ** 64}::UBIGINT)) >> 11) / 9007199254740992.0)"
+
+
+# Write one monthly file with n clean trips plus the injected bad rows, and return the number of rows written
+def generate_file(con, path, color, year, month, n, seed, rates):
+    prefix = PREFIXES[color]
+    days = calendar.monthrange(year, month)[1]
+
+    # Bad-row kinds take consecutive slices of one draw, so each row has at most one problem
+    zero_passengers = rates['zero_passenger_rate']
+    zero_distance = zero_passengers + rates['zero_distance_rate']
+    long_distance = zero_distance + rates['long_distance_rate']
+    long_duration = long_distance + rates['long_duration_rate']
+
+    return con.execute(f"""
+        COPY (
+            WITH trips AS (
+                SELECT
+                    i,
+                    {uniform(0)} AS u_pickup,
+                    {uniform(1)} AS u_duration,
+                    {uniform(2)} AS u_passengers,
+                    {uniform(3)} AS u_distance,
+                    {uniform(4)} AS u_kind,
+                    {uniform(5)} AS u_duplicate
+                FROM range({n}) t(i), (SELECT hash({seed}, '{color}', {year}, {month}) AS file_seed)
+            ),
+            rows AS (
+                SELECT
+                    i,
+                    CAST(1 + (i % 2) AS INTEGER) AS VendorID,
+                    make_timestamp({year}, {month}, 1, 0, 0, 0)
+                        + to_seconds(CAST(u_pickup * {days * 86400} AS BIGINT)) AS {prefix}_pickup_datetime,
+                    CASE WHEN u_kind >= {long_distance} AND u_kind < {long_duration}
+                         THEN 86401 + CAST(u_duration * 172800 AS BIGINT)
+                         ELSE 120 + CAST(u_duration * u_duration * 5400 AS BIGINT) END AS duration_seconds,
+                    CASE WHEN u_kind < {zero_passengers} THEN 0
+                         ELSE 1 + CAST(floor(pow(u_passengers, 3) * 6) AS BIGINT) END AS passenger_count,
+                    CASE WHEN u_kind >= {zero_passengers} AND u_kind < {zero_distance} THEN 0.0
+                         WHEN u_kind >= {zero_distance} AND u_kind < {long_distance} THEN round(100.01 + u_distance * 400, 2)
+                         ELSE round(0.3 + u_distance * u_distance * 25, 2) END AS trip_distance,
+                    u_duplicate
+                FROM trips
+            ),
+            copies AS (
+                SELECT *, 0 AS copy FROM rows
+                UNION ALL
+                SELECT *, 1 AS copy FROM rows WHERE u_duplicate < {rates['duplicate_rate']}
+            )
+            SELECT
+                VendorID,
+                {prefix}_pickup_datetime,
+                {prefix}_pickup_datetime + to_seconds(duration_seconds) AS {prefix}_dropoff_datetime,
+                passenger_count,
+                trip_distance,
+                round(3.0 + trip_distance * 2.5, 2) AS fare_amount
+            FROM copies
+            ORDER BY i, copy
+        ) TO '{path}' (FORMAT parquet);
+    """).fetchone()[0]
+
+
+# Generate deterministic yellow and green monthly files in output_dir, named like the TLC's so load.py can read
+# them through TLC_BASE_URL; rows_per_file is the yellow file size before bad rows are added
+def generate(output_dir, rows_per_file = 10_000, seed = 0, years = range(2015, 2025), months = range(1, 13),
+             green_fraction = GREEN_FRACTION, **rates):
+    rates = dict(RATES, **rates)
+    os.makedirs(output_dir, exist_ok = True)
+    con = connect(':memory:')  # Large files are sorted within the resource profile's memory, spilling if needed
+
+    files = []
+    for color in ['yellow', 'green']:
+        n = rows_per_file if color == 'yellow' else max(1, int(rows_per_file * green_fraction))
+        for year in years:
+            for month in months:
+                name = source_name(color, year, f'{month:02d}')
+                rows = generate_file(con, os.path.join(output_dir, name), color, year, month, n, seed, rates)
+                files.append({'name': name, 'rows': rows})
+                logger.info(f"Generated {name} ({rows} rows)")
+
+    # Record how the files were made so a benchmark run can be reproduced
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump({'generator_version': GENERATOR_VERSION, 'seed': seed, 'rows_per_file': rows_per_file, 'green_fraction': green_fraction,
+                   'rates': rates, 'files': files}, f, indent = 2)
+    con.close()
+    return files
+
+
+# Generate files if script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_dir')
+    parser.add_argument('--rows-per-file', type = int, default = 10_000)
+    parser.add_argument('--seed', type = int, default = 0)
+    for rate, default in RATES.items():
+        parser.add_argument(f"--{rate.replace('_', '-')}", type = float, default = default)
+    args = vars(parser.parse_args())
+    try:
+        files = generate(**args)
+        print(f"Generated {len(files)} files with {sum(f['rows'] for f in files)} rows in {args['output_dir']}")
+        logger.info(f"Generated {len(files)} files with {sum(f['rows'] for f in files)} rows in {args['output_dir']}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        logger.error(f"An error occurred: {e}")
@@ -1,3 +1,19 @@
 # dbt handles all transformations
 
-# Use 'dbt run' in the dbt directory
\ No newline at end of file
+# Use 'dbt run' in the dbt directory
+
+# final_yellow_data and final_green_data are incremental: a run only rebuilds the pickup months touched
+# by load batches newer than the tables; use 'dbt run --full-refresh' to rebuild them from scratch.
+# co2_cube, fleet_scenarios, trip_sketches and trip_histograms then re-aggregate only those (color, year, month) cells
+
+# After a pipeline run, 'python query_service.py publish' publishes a read-only snapshot for analysis and the query service
+
+# 'python pipeline.py' runs load, clean, 'dbt run' and analysis in one process and profiles each stage
+
+# DuckDB memory, threads and spill come from resources.py, also for a manual 'dbt run' (through resources_plugin.py);
+# use DUCKDB_PROFILE=low-memory or resources.json to change them on small machines
+
+# trip_sketches and trip_histograms hold mergeable per-partition distributions; 'python sketches.py' prints percentiles from them
+
+# 'python parallel.py' builds each color in its own database (dbt targets yellow and green) in parallel processes,
+# then copies both into emissions_combined.duckdb and runs the cross-color models there with 'dbt run --target combined'